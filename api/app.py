@@ -1,10 +1,28 @@
-from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError
-from flask import Flask, request, jsonify
+from concurrent.futures import ThreadPoolExecutor, TimeoutError, wait as wait_futures
+from flask import Flask, Response, g, request, jsonify, stream_with_context
 from datetime import datetime
 from io import StringIO
 import configparser
 import subprocess
 import threading
+import sqlite3
+import fcntl
+import ctypes.util
+import ctypes
+import fnmatch
+import heapq
+import collections
+import contextlib
+import uuid
+import hashlib
+import socket
+import http.client
+import urllib.parse
+import ipaddress
+import bisect
+import secrets
+import select
+import struct
 import paramiko
 import logging
 import time
@@ -16,116 +34,813 @@ import pwd
 import os
 
 app = Flask(__name__)
-collab_session_owner = ""
-
-def read_settings_conf():
-    settings = {
-        "session_type": "virtual",
-        "dcv_collab": "false",
-        "session_auto_creation_by_dcv": "false",
-        "session_timeout": 3600,
-        "dcv_collab_prompt_timeout": 20,
-        "dcv_collab_session_name": "",
-        "dcv_collab_sessions_permissions_dir": "/etc/dcv-management/sessions-permissions.d",
-        "dcv_management_maintenance_dir": "/etc/dcv-management/notifications.d/",
-        "dcv_management_maintenance_timeout": "20"
-    }
-    try:
-        with open('/etc/dcv-management/settings.conf', 'r') as file:
-            for line in file:
-                line = line.strip()
-                if not line or line.startswith('#'):
-                    continue
-                if '=' in line:
-                    key, value = line.split('=', 1)
-                    key = key.strip()
-                    value = value.strip()
-                    
-                    # Remove surrounding single or double quotes from the value if present
-                    if (value.startswith('"') and value.endswith('"')) or (value.startswith("'") and value.endswith("'")):
-                        value = value[1:-1].strip()
-                    
-                    # Update settings only if the key is one of the expected keys
-                    if key in settings:
-                        settings[key] = value
-    except FileNotFoundError:
-        print("settings.conf not found. Using default fallback values.")
-    except Exception as e:
-        print(f"Error reading settings.conf: {e}. Using default fallback values.")
-    return settings
+session_inventory_ttl = 2  # seconds a "dcv list-sessions" result is reused
 
-def manage_permission_file(collab_session_owner, collab_session_name, new_permission_line=None, overwrite=False):
-    settings = read_settings_conf()
-    session_perm_dir = settings.get('dcv_collab_sessions_permissions_dir', '')
+class DcvSession:
+    """One entry of "dcv list-sessions --json"."""
+
+    __slots__ = ("id", "name", "owner", "type", "num_connections", "creation_time", "last_disconnection_time")
+
+    def __init__(self, id, name, owner, type, num_connections, creation_time, last_disconnection_time):
+        self.id = id
+        self.name = name
+        self.owner = owner
+        self.type = type
+        self.num_connections = num_connections
+        self.creation_time = creation_time
+        self.last_disconnection_time = last_disconnection_time
+
+    @classmethod
+    def from_json(cls, data):
+        return cls(
+            id=data.get("id"),
+            name=data.get("name"),
+            owner=data.get("owner"),
+            type=data.get("type"),
+            num_connections=int(data.get("num-of-connections") or 0),
+            creation_time=data.get("creation-time"),
+            last_disconnection_time=data.get("last-disconnection-time")
+        )
+
+class SessionIndex:
+    """Sessions from one "dcv list-sessions --json" run, indexed by id, owner and type."""
+
+    __slots__ = ("raw", "sessions", "by_id", "by_owner", "by_type")
+
+    def __init__(self, raw):
+        self.raw = raw
+        self.sessions = tuple(DcvSession.from_json(entry) for entry in raw)
+        self.by_id = {}
+        self.by_owner = {}
+        self.by_type = {}
+        for session in self.sessions:
+            self.by_id[session.id] = session
+            self.by_owner.setdefault(session.owner, []).append(session)
+            self.by_type.setdefault(session.type, []).append(session)
+
+    @classmethod
+    def from_json(cls, output):
+        raw = json.loads(output)
+        if not isinstance(raw, list):
+            raise ValueError("dcv list-sessions did not return a JSON list")
+        return cls(raw)
+
+    def get(self, session_id):
+        return self.by_id.get(session_id)
+
+    def owned_by(self, owner):
+        return self.by_owner.get(owner, [])
+
+    def of_type(self, session_type):
+        return self.by_type.get(session_type, [])
+
+    def first(self):
+        return self.sessions[0] if self.sessions else None
+
+    def owners(self):
+        return [session.owner for session in self.sessions if session.owner]
+
+class DcvCommandCache:
+    """Caches the result of a read-only dcv command for a short TTL.
+
+    Concurrent callers that miss the cache share one in-flight execution
+    instead of forking their own dcv process. invalidate() drops the cached
+    result and detaches any in-flight call, so the next caller of this
+    process sees the state after a create-session/close-session; the other
+    API worker processes see it when their result expires.
+    """
+
+    def __init__(self, name, command, parser=None):
+        self.name = name
+        self.command = command
+        self.parser = parser
+        self.lock = threading.Lock()
+        self.result = None
+        self.timestamp = 0.0
+        self.generation = 0
+        self.inflight = None
+        self.hits = 0
+        self.misses = 0
+        self.shared = 0
+
+    def get(self, ttl=None):
+        if ttl is None:
+            ttl = session_inventory_ttl
+        with self.lock:
+            if self.result is not None and time.monotonic() - self.timestamp < ttl:
+                self.hits += 1
+                return self.result
+            inflight = self.inflight
+            leader = inflight is None
+            if leader:
+                self.misses += 1
+            else:
+                self.shared += 1
+            if leader:
+                inflight = {"event": threading.Event(), "result": None, "generation": self.generation}
+                self.inflight = inflight
+
+        if not leader:
+            inflight["event"].wait()
+            return inflight["result"]
+
+        result = {"returncode": -1, "stdout": "", "stderr": "", "data": None, "parse_error": None}
+        try:
+            result = self.execute()
+        except Exception as e:
+            result["stderr"] = str(e)
+        finally:
+            # the callers waiting on this execution must always be released
+            with self.lock:
+                if inflight["generation"] == self.generation and result["returncode"] == 0 and not result["parse_error"]:
+                    self.result = result
+                    self.timestamp = time.monotonic()
+                if self.inflight is inflight:
+                    self.inflight = None
+            inflight["result"] = result
+            inflight["event"].set()
+        return result
+
+    def execute(self):
+        result = {"returncode": -1, "stdout": "", "stderr": "", "data": None, "parse_error": None}
+        process = dcv_executor.run(self.command)
+        result["returncode"] = process.returncode
+        result["stdout"] = process.stdout
+        result["stderr"] = process.stderr
+        if self.parser is not None and process.returncode == 0:
+            try:
+                result["data"] = self.parser(process.stdout)
+            except Exception as e:
+                result["parse_error"] = str(e)
+        return result
+
+    def invalidate(self):
+        with self.lock:
+            self.generation += 1
+            self.result = None
+            self.inflight = None
+
+session_inventory = DcvCommandCache("session_inventory", ["dcv", "list-sessions", "--json"], parser=SessionIndex.from_json)
+session_inventory_text = DcvCommandCache("session_inventory_text", ["dcv", "list-sessions"])
+
+def invalidate_session_inventory():
+    session_inventory.invalidate()
+    session_inventory_text.invalidate()
+
+def get_session_index():
+    """Return the cached SessionIndex, or None if dcv list-sessions failed."""
+    return session_inventory.get()["data"]
+
+def get_first_session_id():
+    index = get_session_index()
+    if index is None:
+        return None
+    first = index.first()
+    return first.id if first is not None else None
+
+def parse_bool(value):
+    if isinstance(value, bool):
+        return value
+    value = str(value).strip().lower()
+    if value in ("true", "yes", "on", "1"):
+        return True
+    if value in ("false", "no", "off", "0", ""):
+        return False
+    raise ValueError(f"'{value}' is not a boolean")
+
+def parse_non_negative_int(value):
+    value = int(str(value).strip())
+    if value < 0:
+        raise ValueError(f"'{value}' is negative")
+    return value
+
+def parse_session_type(value):
+    value = str(value).strip().lower()
+    if value not in ["console", "virtual"]:
+        raise ValueError(f"The session type >>> {value} <<< was not recognized")
+    return value
+
+def parse_expired_action(value):
+    value = str(value).strip().lower()
+    if value not in ["archive", "delete", "keep"]:
+        raise ValueError(f"The expired action >>> {value} <<< was not recognized")
+    return value
+
+def parse_str(value):
+    return str(value).strip()
+
+def parse_url_list(value):
+    urls = tuple(url.strip().rstrip("/") for url in value.split(",") if url.strip())
+    for url in urls:
+        if urllib.parse.urlsplit(url).scheme not in ("http", "https"):
+            raise ValueError(f"'{url}' is not a http(s) URL")
+    return urls
+
+def parse_name_list(value):
+    return tuple(name.strip() for name in str(value).split(",") if name.strip())
+
+# setting name: (default value, parser)
+SETTINGS_SCHEMA = {
+    "session_type": ("virtual", parse_session_type),
+    "dcv_collab": (False, parse_bool),
+    "session_auto_creation_by_dcv": (False, parse_bool),
+    "session_timeout": (3600, parse_non_negative_int),
+    "dcv_collab_prompt_timeout": (20, parse_non_negative_int),
+    "dcv_collab_session_name": ("", parse_str),
+    "dcv_collab_max_prompts_per_owner": (3, parse_non_negative_int),
+    "dcv_collab_approval_cache_ttl": (900, parse_non_negative_int),
+    "dcv_collab_prompt_script": ("/usr/bin/dcv_collab_prompt", parse_str),
+    "dcv_notify_users_script": ("/usr/bin/dcv_notify_users", parse_str),
+    "dcv_collab_sessions_permissions_dir": ("/etc/dcv-management/sessions-permissions.d", parse_str),
+    "permissions_apply_window_ms": (50, parse_non_negative_int),
+    "dcv_management_maintenance_dir": ("/etc/dcv-management/notifications.d/", parse_str),
+    "dcv_management_maintenance_timeout": (20, parse_non_negative_int),
+    "dcv_management_maintenance_expired_action": ("archive", parse_expired_action),
+    "dcv_management_maintenance_max_concurrency": (20, parse_non_negative_int),
+    "session_timeout_sweep_interval": (300, parse_non_negative_int),
+    "session_timeout_sweep_workers": (8, parse_non_negative_int),
+    "session_timeout_cpu_threshold": (0, parse_non_negative_int),
+    "session_timeout_cpu_minutes": (30, parse_non_negative_int),
+    "activity_sample_interval": (30, parse_non_negative_int),
+    "memory_pressure_interval": (10, parse_non_negative_int),
+    "memory_pressure_min_available_percent": (0, parse_non_negative_int),
+    "memory_pressure_max_psi_some": (0, parse_non_negative_int),
+    "memory_pressure_settle_seconds": (5, parse_non_negative_int),
+    "memory_pressure_protect": ((), parse_name_list),
+    "memory_pressure_dry_run": (False, parse_bool),
+    "dcv_management_bind": ("127.0.0.1:5000", parse_str),
+    "dcv_management_workers": (2, parse_non_negative_int),
+    "dcv_management_threads": (8, parse_non_negative_int),
+    "dcv_management_state_dir": ("/var/lib/dcv-management", parse_str),
+    "dcv_tokens_path": ("/opt/dcv_tokens/", parse_str),
+    "metrics_publish_interval": (5, parse_non_negative_int),
+    "fleet_peers": ((), parse_url_list),
+    "fleet_peer_timeout": (3, parse_non_negative_int),
+    "fleet_snapshot_ttl": (2, parse_non_negative_int),
+    "fleet_snapshot_max_age": (300, parse_non_negative_int),
+    "placement_min_free_memory_mb": (1024, parse_non_negative_int),
+    "session_watch_interval": (2, parse_non_negative_int),
+    "session_watch_stream_timeout": (300, parse_non_negative_int),
+    "session_watch_max_streams": (2, parse_non_negative_int),
+    "session_events_retention": (3600, parse_non_negative_int),
+    "ssh_pool_max_per_host": (4, parse_non_negative_int),
+    "ssh_pool_idle_timeout": (300, parse_non_negative_int),
+    "ssh_keepalive_interval": (30, parse_non_negative_int),
+    "dcv_command_timeout": (60, parse_non_negative_int),
+    "dcv_command_max_concurrency": (16, parse_non_negative_int),
+    "dcv_command_max_concurrency_per_command": (8, parse_non_negative_int),
+    "prompt_command_timeout": (120, parse_non_negative_int),
+    "prompt_command_max_concurrency": (200, parse_non_negative_int),
+    "prompt_command_max_concurrency_per_command": (200, parse_non_negative_int)
+}
+
+class Settings:
+    """Typed values of settings.conf, parsed once per file change.
+
+    Every access to current() costs one stat() call; the file is parsed
+    again only when its inode, mtime or size changed. version is bumped on
+    each reload, so other caches can key on it.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.signature = False  # never matches a real stat signature
+        self.values = {}
+        self.version = 0
+
+    def __getattr__(self, name):
+        try:
+            return self.__dict__["values"][name]
+        except KeyError:
+            raise AttributeError(name)
+
+    def file_signature(self):
+        try:
+            file_stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return (file_stat.st_ino, file_stat.st_mtime_ns, file_stat.st_size)
+
+    def current(self):
+        signature = self.file_signature()
+        if signature != self.signature:
+            with self.lock:
+                if signature != self.signature:
+                    self.values = self.load(signature)
+                    self.signature = signature
+                    self.version += 1
+        return self
+
+    def load(self, signature):
+        raw = {}
+        if signature is None:
+            print("settings.conf not found. Using default fallback values.")
+        else:
+            try:
+                with open(self.path, 'r') as file:
+                    for line in file:
+                        line = line.strip()
+                        if not line or line.startswith('#'):
+                            continue
+                        if '=' in line:
+                            key, value = line.split('=', 1)
+                            key = key.strip()
+                            value = value.strip()
+
+                            # Remove surrounding single or double quotes from the value if present
+                            if (value.startswith('"') and value.endswith('"')) or (value.startswith("'") and value.endswith("'")):
+                                value = value[1:-1].strip()
+
+                            # Keep only the expected keys
+                            if key in SETTINGS_SCHEMA:
+                                raw[key] = value
+            except Exception as e:
+                print(f"Error reading settings.conf: {e}. Using default fallback values.")
+
+        values = {}
+        for key, (default, parser) in SETTINGS_SCHEMA.items():
+            values[key] = default
+            if key in raw:
+                try:
+                    values[key] = parser(raw[key])
+                except ValueError as e:
+                    print(f"Invalid value for '{key}' in settings.conf: {e}. Using the default value >>> {default} <<<.")
+        return values
+
+settings_store = Settings(os.environ.get('DCV_MANAGEMENT_SETTINGS', '/etc/dcv-management/settings.conf'))
+
+def get_settings():
+    return settings_store.current()
+
+class SharedStore:
+    """Small SQLite key/value store for the state shared by all API worker processes."""
+
+    def __init__(self, path):
+        self.path = path
+        self.local = threading.local()
+
+    def connection(self):
+        connection = getattr(self.local, "connection", None)
+        if connection is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("CREATE TABLE IF NOT EXISTS state (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+            connection.execute("CREATE TABLE IF NOT EXISTS jobs (id TEXT PRIMARY KEY, kind TEXT NOT NULL, data TEXT NOT NULL, updated REAL NOT NULL)")
+            connection.execute("CREATE TABLE IF NOT EXISTS notification_deliveries (notification TEXT NOT NULL, user TEXT NOT NULL, status TEXT NOT NULL, answer TEXT, delivered REAL NOT NULL)")
+            connection.execute("CREATE INDEX IF NOT EXISTS notification_deliveries_key ON notification_deliveries (notification, user, status)")
+            connection.execute("CREATE TABLE IF NOT EXISTS tokens (token TEXT PRIMARY KEY, user TEXT NOT NULL, issued REAL NOT NULL, expires REAL NOT NULL, revoked REAL)")
+            connection.execute("CREATE INDEX IF NOT EXISTS tokens_active ON tokens (revoked, expires)")
+            connection.execute("CREATE TABLE IF NOT EXISTS approvals (id TEXT PRIMARY KEY, owner TEXT NOT NULL, collaborator TEXT NOT NULL, session TEXT NOT NULL, connections INTEGER NOT NULL, status TEXT NOT NULL, result TEXT, pid INTEGER NOT NULL, created REAL NOT NULL, updated REAL NOT NULL)")
+            connection.execute("CREATE INDEX IF NOT EXISTS approvals_owner ON approvals (owner, status)")
+            connection.execute("CREATE INDEX IF NOT EXISTS approvals_key ON approvals (session, owner, collaborator, status)")
+            connection.execute("CREATE TABLE IF NOT EXISTS activity_samples (owner TEXT NOT NULL, sampled REAL NOT NULL, cpu REAL NOT NULL, rss INTEGER NOT NULL, io REAL NOT NULL)")
+            connection.execute("CREATE INDEX IF NOT EXISTS activity_samples_owner ON activity_samples (owner, sampled)")
+            connection.execute("CREATE TABLE IF NOT EXISTS session_events (version INTEGER PRIMARY KEY AUTOINCREMENT, type TEXT NOT NULL, session TEXT NOT NULL, data TEXT NOT NULL, created REAL NOT NULL)")
+            self.local.connection = connection
+        return connection
+
+    def get(self, key, default=None):
+        row = self.connection().execute("SELECT value FROM state WHERE key = ?", (key,)).fetchone()
+        return row[0] if row is not None else default
+
+    def set(self, key, value):
+        self.connection().execute("INSERT OR REPLACE INTO state (key, value) VALUES (?, ?)", (key, str(value)))
+
+    def delete(self, key):
+        self.connection().execute("DELETE FROM state WHERE key = ?", (key,))
+
+    def items(self, prefix):
+        return self.connection().execute("SELECT key, value FROM state WHERE substr(key, 1, ?) = ?", (len(prefix), prefix)).fetchall()
+
+    def set_job(self, job_id, kind, data):
+        self.connection().execute("INSERT OR REPLACE INTO jobs (id, kind, data, updated) VALUES (?, ?, ?, ?)", (job_id, kind, json.dumps(data), time.time()))
+
+    def get_job(self, job_id, kind):
+        row = self.connection().execute("SELECT data FROM jobs WHERE id = ? AND kind = ?", (job_id, kind)).fetchone()
+        return json.loads(row[0]) if row is not None else None
+
+    def prune_jobs(self, max_age):
+        self.connection().execute("DELETE FROM jobs WHERE updated < ?", (time.time() - max_age,))
+
+    @contextlib.contextmanager
+    def transaction(self):
+        connection = self.connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            yield connection
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+
+    def increment(self, key):
+        with self.transaction() as connection:
+            row = connection.execute("SELECT value FROM state WHERE key = ?", (key,)).fetchone()
+            value = int(row[0]) + 1 if row is not None else 1
+            connection.execute("INSERT OR REPLACE INTO state (key, value) VALUES (?, ?)", (key, str(value)))
+        return value
+
+shared_store = SharedStore(os.path.join(get_settings().dcv_management_state_dir, "state.db"))
+
+class ConcurrencyLimiter:
+    """Counting semaphore whose limit can be changed while it is in use."""
+
+    def __init__(self, limit):
+        self.limit = max(1, limit)
+        self.active = 0
+        self.waiting = 0
+        self.condition = threading.Condition()
+
+    def set_limit(self, limit):
+        limit = max(1, limit)
+        if limit != self.limit:
+            with self.condition:
+                self.limit = limit
+                self.condition.notify_all()
+
+    def acquire(self):
+        with self.condition:
+            self.waiting += 1
+            while self.active >= self.limit:
+                self.condition.wait()
+            self.waiting -= 1
+            self.active += 1
+
+    def release(self):
+        with self.condition:
+            self.active -= 1
+            self.condition.notify()
+
+class Histogram:
+    """Latency histogram with fixed buckets, in seconds. The caller serializes observe() calls."""
+
+    BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self):
+        # the last count is for the values above the last bucket
+        self.counts = [0] * (len(self.BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.BUCKETS, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def snapshot(self):
+        return {"counts": list(self.counts), "sum": self.sum, "count": self.count}
+
+class CommandResult:
+    __slots__ = ("command", "returncode", "stdout", "stderr", "duration", "wait_time", "timed_out")
+
+    def __init__(self, command):
+        self.command = command
+        self.returncode = -1
+        self.stdout = ""
+        self.stderr = ""
+        self.duration = 0.0
+        self.wait_time = 0.0
+        self.timed_out = False
+
+def command_key(command):
+    """Name used to group invocations, e.g. "dcv list-sessions" for "sudo -u dcv dcv list-sessions --json"."""
+    args = list(command)
+    if args and os.path.basename(args[0]) == "sudo":
+        args = args[1:]
+        while args and args[0].startswith("-"):
+            args = args[2:] if args[0] in ("-u", "-g") else args[1:]
+    if not args:
+        return ""
+    name = os.path.basename(args[0])
+    if name == "dcv" and len(args) > 1:
+        return f"dcv {args[1]}"
+    return name
+
+class CommandExecutor:
+    """Runs external commands without a shell, with timeouts and concurrency caps.
+
+    Every command waits for a slot of its own command key and then for a
+    global slot. The time spent waiting, the exit code and the duration of
+    each invocation are recorded in stats.
+    """
+
+    def __init__(self, name, timeout_setting, max_concurrency_setting, max_concurrency_per_command_setting):
+        self.name = name
+        self.timeout_setting = timeout_setting
+        self.max_concurrency_setting = max_concurrency_setting
+        self.max_concurrency_per_command_setting = max_concurrency_per_command_setting
+        settings = get_settings()
+        self.global_limiter = ConcurrencyLimiter(getattr(settings, max_concurrency_setting))
+        self.command_limiters = {}
+        self.lock = threading.Lock()
+        self.stats = {}
+
+    def limiter_for(self, key, limit):
+        with self.lock:
+            limiter = self.command_limiters.get(key)
+            if limiter is None:
+                limiter = self.command_limiters[key] = ConcurrencyLimiter(limit)
+        limiter.set_limit(limit)
+        return limiter
+
+    def run(self, command, timeout=None, env=None, input=None):
+        settings = get_settings()
+        if timeout is None:
+            timeout = getattr(settings, self.timeout_setting) or None
+        key = command_key(command)
+        command_limiter = self.limiter_for(key, getattr(settings, self.max_concurrency_per_command_setting))
+        self.global_limiter.set_limit(getattr(settings, self.max_concurrency_setting))
+
+        result = CommandResult(command)
+        queued = time.monotonic()
+        command_limiter.acquire()
+        try:
+            self.global_limiter.acquire()
+            try:
+                started = time.monotonic()
+                result.wait_time = started - queued
+                if result.wait_time > 1:
+                    logging.warning(f"[DCV Management Command] '{key}' waited {result.wait_time:.2f} seconds for a free {self.name} slot.")
+                try:
+                    if input is None:
+                        process = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, stdin=subprocess.DEVNULL, text=True, timeout=timeout, env=env)
+                    else:
+                        process = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, input=input, text=True, timeout=timeout, env=env)
+                    result.returncode = process.returncode
+                    result.stdout = process.stdout
+                    result.stderr = process.stderr
+                except subprocess.TimeoutExpired as e:
+                    result.timed_out = True
+                    result.stdout = e.stdout.decode() if isinstance(e.stdout, bytes) else (e.stdout or "")
+                    result.stderr = f"Command '{key}' timed out after {timeout} seconds."
+                except Exception as e:
+                    result.stderr = str(e)
+                result.duration = time.monotonic() - started
+            finally:
+                self.global_limiter.release()
+        finally:
+            command_limiter.release()
+
+        self.record(key, result)
+        return result
+
+    def record(self, key, result):
+        with self.lock:
+            stats = self.stats.get(key)
+            if stats is None:
+                stats = self.stats[key] = {"count": 0, "timeouts": 0, "duration": 0.0, "wait_time": 0.0, "exit_codes": {}, "histogram": Histogram()}
+            stats["count"] += 1
+            stats["duration"] += result.duration
+            stats["histogram"].observe(result.duration)
+            stats["wait_time"] += result.wait_time
+            if result.timed_out:
+                stats["timeouts"] += 1
+            else:
+                stats["exit_codes"][result.returncode] = stats["exit_codes"].get(result.returncode, 0) + 1
+        logging.debug(f"[DCV Management Command] '{key}' exited with {result.returncode} in {result.duration:.3f} seconds (waited {result.wait_time:.3f} seconds).")
+
+    def snapshot(self):
+        with self.lock:
+            return {key: dict(stats, exit_codes=dict(stats["exit_codes"]), histogram=stats["histogram"].snapshot()) for key, stats in self.stats.items()}
+
+# dcv CLI and other short commands
+dcv_executor = CommandExecutor("command", "dcv_command_timeout", "dcv_command_max_concurrency", "dcv_command_max_concurrency_per_command")
+# helper scripts that wait for a user answer (collab prompt, notifications)
+prompt_executor = CommandExecutor("prompt", "prompt_command_timeout", "prompt_command_max_concurrency", "prompt_command_max_concurrency_per_command")
+
+class PermissionFile:
+    """Parsed DCV permission file: the [groups], [aliases] and [permissions] sections as lists of entries."""
+
+    SECTIONS = ("groups", "aliases", "permissions")
+
+    def __init__(self):
+        self.preamble = []
+        self.sections = {name: [] for name in self.SECTIONS}
+
+    @classmethod
+    def template(cls, owner):
+        permission_file = cls()
+        permission_file.sections["permissions"].append(f"{owner} allow builtin")
+        return permission_file
+
+    @classmethod
+    def parse(cls, content):
+        permission_file = cls()
+        entries = permission_file.preamble
+        for line in content.splitlines():
+            line = line.strip()
+            if not line:
+                continue
+            if line.startswith("[") and line.endswith("]"):
+                entries = permission_file.sections.setdefault(line[1:-1].strip(), [])
+            else:
+                entries.append(line)
+        return permission_file
+
+    def render(self):
+        lines = list(self.preamble)
+        if lines:
+            lines.append("")
+        for name, entries in self.sections.items():
+            lines.append(f"[{name}]")
+            lines.extend(entries)
+            lines.append("")
+        return "\n".join(lines)
+
+    def permissions_of(self, user):
+        return [line for line in self.sections["permissions"] if line.split()[0] == user]
+
+    def add_permission(self, line):
+        if line in self.sections["permissions"]:
+            return False
+        self.sections["permissions"].append(line)
+        return True
+
+    def remove_permission(self, line):
+        if line not in self.sections["permissions"]:
+            return False
+        self.sections["permissions"].remove(line)
+        return True
+
+    def replace_permissions(self, user, lines):
+        entries = self.sections["permissions"]
+        self.sections["permissions"] = [line for line in entries if line.split()[0] != user] + list(lines)
+        return self.sections["permissions"] != entries
+
+class SessionPermissions:
+    """Permission file of one session, kept parsed in memory and reloaded if it is changed on disk."""
+
+    def __init__(self, session_name, path):
+        self.session_name = session_name
+        self.path = path
+        self.lock = threading.Lock()
+        self.apply_lock = threading.Lock()
+        self.permission_file = None
+        self.signature = None
+        self.batch = None
+        # changes applied in memory but not written yet
+        self.pending = []
+
+    def file_signature(self):
+        try:
+            file_stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return (file_stat.st_ino, file_stat.st_mtime_ns, file_stat.st_size)
+
+    def load(self):
+        """Read the file again if it was changed on disk, replaying the changes not written yet on top of it."""
+        signature = self.file_signature()
+        if self.permission_file is not None and signature == self.signature:
+            return
+        if signature is None:
+            permission_file = None
+        else:
+            with open(self.path) as f:
+                permission_file = PermissionFile.parse(f.read())
+        for function in self.pending:
+            permission_file, _ = function(permission_file)
+        self.permission_file = permission_file
+        self.signature = signature
+
+    def discard(self):
+        """Forget the changes not written, the next load() reads the file again."""
+        self.permission_file = None
+        self.signature = None
+        self.pending = []
+
+    def write(self):
+        temporary_path = os.path.join(os.path.dirname(self.path), f".{os.path.basename(self.path)}.{os.getpid()}.tmp")
+        with open(temporary_path, "w") as f:
+            f.write(self.permission_file.render())
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporary_path, self.path)
+        self.signature = self.file_signature()
+
+class PermissionBatch:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+class PermissionManager:
+    """Applies permission changes of collab sessions.
+
+    Changes are applied to the parsed file of the session under its lock.
+    The changes arriving within permissions_apply_window_ms are written
+    together (write to a temporary file and rename) and applied with a
+    single dcv set-permissions call, whose result is shared by all of them.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.sessions = {}
+
+    def session(self, session_name, path):
+        with self.lock:
+            session_permissions = self.sessions.get(path)
+            if session_permissions is None:
+                session_permissions = self.sessions[path] = SessionPermissions(session_name, path)
+            return session_permissions
+
+    def change(self, session_name, path, function):
+        """Call function with the parsed permission file (None if it does not exist) and apply the file it returns.
+
+        Returns (changed, result), result being the CommandResult of the
+        set-permissions call that applied the change.
+        """
+        session_permissions = self.session(session_name, path)
+        with session_permissions.lock:
+            session_permissions.load()
+            permission_file, changed = function(session_permissions.permission_file)
+            if permission_file is None:
+                raise FileNotFoundError(f"Permission file '{path}' does not exist.")
+            session_permissions.permission_file = permission_file
+            session_permissions.pending.append(function)
+            batch = session_permissions.batch
+            leader = batch is None
+            if leader:
+                batch = session_permissions.batch = PermissionBatch()
+
+        if not leader:
+            batch.done.wait()
+            if batch.error is not None:
+                raise batch.error
+            return changed, batch.result
+
+        try:
+            time.sleep(get_settings().permissions_apply_window_ms / 1000)
+            # one apply at a time per session; the changes arriving meanwhile go to the next batch
+            with session_permissions.apply_lock:
+                with session_permissions.lock:
+                    session_permissions.batch = None
+                    try:
+                        # the file may have been changed on disk during the window
+                        session_permissions.load()
+                        if session_permissions.permission_file is None:
+                            raise FileNotFoundError(f"Permission file '{path}' was removed before the changes were written.")
+                        session_permissions.write()
+                    except Exception:
+                        # the callers of this batch get the error, a later batch must not write their changes
+                        session_permissions.discard()
+                        raise
+                    session_permissions.pending = []
+                batch.result = dcv_executor.run(["sudo", "-u", "dcv", "dcv", "set-permissions", "--session", session_name, "--file", path])
+        except Exception as e:
+            with session_permissions.lock:
+                if session_permissions.batch is batch:
+                    session_permissions.batch = None
+            batch.error = e
+            raise
+        finally:
+            batch.done.set()
+        return changed, batch.result
+
+permission_manager = PermissionManager()
 
+def get_permission_file_path(collab_session_name):
+    session_perm_dir = get_settings().dcv_collab_sessions_permissions_dir
     if not session_perm_dir:
+        return None
+    return os.path.join(session_perm_dir, f"{collab_session_name}.perm")
+
+def manage_permission_file(collab_session_owner, collab_session_name, new_permission_line=None, overwrite=False):
+    perm_file_path = get_permission_file_path(collab_session_name)
+
+    if not perm_file_path:
         return create_response(
             message="Session permissions directory is not configured.",
             stdout=None,
             stderr=None,
             return_code=500
         )
-    
-    perm_file_path = os.path.join(session_perm_dir, f"{collab_session_name}.perm")
-    created = False
-
-    # Create or overwrite file with a base template
-    if overwrite or not os.path.exists(perm_file_path):
-        content = (
-            "[groups]\n\n"
-            "[aliases]\n\n"
-            "[permissions]\n"
-            f"{collab_session_owner} allow builtin\n"
+
+    created = []
+
+    def update(permission_file):
+        # Create or overwrite file with a base template
+        if overwrite or permission_file is None:
+            created.append(True)
+            permission_file = PermissionFile.template(collab_session_owner)
+            return permission_file, True
+        if new_permission_line:
+            return permission_file, permission_file.add_permission(new_permission_line)
+        return permission_file, False
+
+    try:
+        changed, result = permission_manager.change(collab_session_name, perm_file_path, update)
+    except Exception as e:
+        return create_response(
+            message="Error writing the permission file.",
+            stdout=None,
+            stderr=str(e),
+            return_code=500
         )
-        with open(perm_file_path, 'w') as f:
-            f.write(content)
-        created = True
-    elif new_permission_line:
-        # File exists so update it: add new_permission_line to the [permissions] section if missing
-        with open(perm_file_path, 'r') as f:
-            lines = f.readlines()
-
-        updated = False
-        new_lines = []
-        in_permissions = False
-        for i, line in enumerate(lines):
-            new_lines.append(line)
-            if line.strip() == "[permissions]":
-                in_permissions = True
-                # Check whether the new_permission_line is already present until another section starts
-                found = False
-                for subsequent_line in lines[i+1:]:
-                    if subsequent_line.strip().startswith('['):  # reached next section
-                        break
-                    if subsequent_line.strip() == new_permission_line:
-                        found = True
-                        break
-                if not found:
-                    new_lines.append(new_permission_line + "\n")
-                    updated = True
-        # If there was no [permissions] section, add one at the end
-        if not in_permissions:
-            new_lines.append("\n[permissions]\n")
-            new_lines.append(new_permission_line + "\n")
-            updated = True
-
-        if updated:
-            with open(perm_file_path, 'w') as f:
-                f.writelines(new_lines)
-
-    # Execute the set-permissions command
-    command = [
-        "sudo",
-        "-u",
-        "dcv",
-        "dcv",
-        "set-permissions",
-        "--session",
-        collab_session_name,
-        "--file",
-        perm_file_path
-    ]
-    result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
 
     if result.returncode != 0:
         return create_response(
@@ -138,7 +853,7 @@ def manage_permission_file(collab_session_owner, collab_session_name, new_permis
     action = "created" if created else "updated"
 
     return create_response(
-        message="Permission file '{perm_file_path}' {action} successfully.",
+        message=f"Permission file '{perm_file_path}' {action} successfully.",
         stdout=result.stdout,
         stderr=result.stderr,
         return_code=200
@@ -146,11 +861,8 @@ def manage_permission_file(collab_session_owner, collab_session_name, new_permis
 
 def session_exists(session_name):
     try:
-        response = get_list_sessions()
-        data = response[0]
-        data_parsed = json.loads(data.get_data(as_text=True))
-        sessions = data_parsed.get("message", "")
-        return f"Session: '{session_name}'" in sessions
+        index = get_session_index()
+        return index is not None and index.get(session_name) is not None
     except Exception as e:
         print(f"Error checking session existence: {e}")
         return False
@@ -165,16 +877,7 @@ def create_response(message, stdout="", stderr="", return_code=200):
     return jsonify(response), return_code
 
 def get_session_type():
-    try:
-        settings = read_settings_conf()
-        session_type = settings.get('session_type', 'virtual').strip().lower()
-        if session_type not in ["console", "virtual"]:
-            print(f"The session type >>> {session_type} <<< was not recognized from settings.conf file.")
-            session_type = "virtual"  # Fallback value
-    except Exception as e:
-        print(f"Error determining session_type: {e}")
-        session_type = "virtual"
-    return session_type
+    return get_settings().session_type
 
 def is_positive_integer(value):
     try:
@@ -186,121 +889,618 @@ def is_positive_integer(value):
 def create_permission_file():
     collab_owner_username = request.args.get('collab_owner_username')
     collab_session_name = request.args.get('collab_session_name')
-    response, status_code = manage_permission_file(collab_session_owner, collab_session_name, overwrite=True)
-    return jsonify(response), status_code
+    response, status_code = manage_permission_file(collab_owner_username, collab_session_name, overwrite=True)
+    return response, status_code
 
 def add_permission():
     collab_owner_username = request.args.get('collab_owner_username')
     collab_session_name = request.args.get('collab_session_name')
     collab_add_username = request.args.get('collab_add_username')
     new_line = f"{collab_add_username} allow display"
-    response, status_code = manage_permission_file(collab_session_owner, collab_session_name, new_permission_line=new_line)
-    return jsonify(response), status_code
+    response, status_code = manage_permission_file(collab_owner_username, collab_session_name, new_permission_line=new_line)
+    return response, status_code
 
 def sanitize_filename(s):
     return re.sub(r'\W+', '', s)
 
+class GnomeSession:
+    """GNOME session process of a user and the environment needed to open dialogs on it."""
+
+    __slots__ = ("user", "pid", "comm", "display", "dbus_address", "xauthority")
+
+    def __init__(self, user, pid, comm, display, dbus_address, xauthority):
+        self.user = user
+        self.pid = pid
+        self.comm = comm
+        self.display = display
+        self.dbus_address = dbus_address
+        self.xauthority = xauthority
+
+    def complete(self):
+        return bool(self.display and self.dbus_address and self.xauthority)
+
+    def environment(self):
+        """Environment for dcv_notify_users/dcv_collab_prompt, so they skip their own discovery."""
+        env = os.environ.copy()
+        env["DCV_USER_DISPLAY"] = self.display
+        env["DCV_USER_DBUS_SESSION_BUS_ADDRESS"] = self.dbus_address
+        env["DCV_USER_XAUTHORITY"] = self.xauthority
+        return env
+
+class GnomeSessionIndex:
+    """Index of user -> GNOME session built by scanning /proc.
+
+    Each refresh only reads the comm of the processes started since the
+    previous one; known processes are skipped and exited ones are dropped.
+    A full rescan is done every full_refresh_interval seconds to recover
+    from reused pids.
+    """
+
+    COMMANDS = ("gnome-session", "gnome-shell")
+
+    def __init__(self, ttl=5, full_refresh_interval=300):
+        self.ttl = ttl
+        self.full_refresh_interval = full_refresh_interval
+        self.lock = threading.Lock()
+        self.processes = {}  # pid -> GnomeSession, or None for other processes
+        self.sessions = {}
+        self.refreshed = 0.0
+        self.full_refreshed = 0.0
+
+    def read_session(self, pid):
+        try:
+            with open(f"/proc/{pid}/comm") as file:
+                comm = file.read().strip()
+            # gnome-session-binary is shown truncated as "gnome-session-b"
+            if not comm.startswith(self.COMMANDS):
+                return None
+            user = pwd.getpwuid(os.stat(f"/proc/{pid}").st_uid).pw_name
+            with open(f"/proc/{pid}/environ", "rb") as file:
+                environ = file.read().split(b"\0")
+        except (OSError, KeyError):
+            return None
+
+        variables = {}
+        for entry in environ:
+            key, _, value = entry.partition(b"=")
+            if key in (b"DISPLAY", b"DBUS_SESSION_BUS_ADDRESS", b"XAUTHORITY"):
+                variables[key.decode()] = value.decode(errors="replace")
+        return GnomeSession(
+            user=user,
+            pid=pid,
+            comm=comm,
+            display=variables.get("DISPLAY", ""),
+            dbus_address=variables.get("DBUS_SESSION_BUS_ADDRESS", ""),
+            # Fallback to default XAUTHORITY if not found
+            xauthority=variables.get("XAUTHORITY") or f"/home/{user}/.Xauthority"
+        )
+
+    def refresh(self, force=False):
+        with self.lock:
+            now = time.monotonic()
+            if not force and now - self.refreshed < self.ttl:
+                return
+            if now - self.full_refreshed >= self.full_refresh_interval:
+                self.processes = {}
+                self.full_refreshed = now
+
+            pids = {int(name) for name in os.listdir("/proc") if name.isdigit()}
+            for pid in list(self.processes):
+                if pid not in pids:
+                    del self.processes[pid]
+            for pid in pids:
+                if pid not in self.processes:
+                    self.processes[pid] = self.read_session(pid)
+
+            sessions = {}
+            for session in self.processes.values():
+                if session is None:
+                    continue
+                current = sessions.get(session.user)
+                # prefer gnome-session over gnome-shell, and processes with the complete environment
+                if current is None or (session.complete(), session.comm.startswith("gnome-session")) > (current.complete(), current.comm.startswith("gnome-session")):
+                    sessions[session.user] = session
+            self.sessions = sessions
+            self.refreshed = now
+
+    def users(self):
+        self.refresh()
+        return list(self.sessions)
+
+    def get(self, user):
+        self.refresh()
+        return self.sessions.get(user)
+
+gnome_session_index = GnomeSessionIndex()
+
 def get_all_gnome_sessions():
-    users = set()
     try:
-        # Run the 'ps' command to list all processes with user and command name.
-        output = subprocess.check_output(["ps", "-eo", "user,comm"], text=True)
-        for line in output.splitlines():
-            if "gnome-session" in line or "gnome-shell" in line:
-                # The first word should be the username.
-                parts = line.split()
-                if parts:
-                    users.add(parts[0])
+        return gnome_session_index.users()
     except Exception as e:
         logging.error(f"Error listing GNOME sessions: {e}")
-    return list(users)
+        return []
 
-def process_notification_file(filepath, target_user=None, filter_type=None):
-    config_data = configparser.ConfigParser()
-    config_data.read(filepath)
-    file_timestamp = int(config_data['date']['timestamp'])
-    notif_type = config_data['notification'].get('type')
-    now = datetime.now().timestamp()
+def gnome_session_environment(user):
+    """Environment that passes the GNOME session of user to the helper scripts, or None if unknown."""
+    try:
+        session = gnome_session_index.get(user)
+    except Exception as e:
+        logging.error(f"Error reading the GNOME session of user '{user}': {e}")
+        return None
+    if session is None or not session.complete():
+        return None
+    return session.environment()
 
-    if filter_type is not None and notif_type != filter_type:
-        return
-    
-    # Get the notification message details.
-    title = config_data['message'].get('title', '')
-    text = config_data['message'].get('text', '')
+class Notification:
+    """One scheduled notification file of the maintenance dir."""
+
+    __slots__ = ("path", "timestamp", "type", "title", "text", "buttons")
+
+    def __init__(self, path, timestamp, type, title, text, buttons):
+        self.path = path
+        self.timestamp = timestamp
+        self.type = type
+        self.title = title
+        self.text = text
+        self.buttons = buttons
+
+    @classmethod
+    def from_file(cls, filepath):
+        config_data = configparser.ConfigParser()
+        if not config_data.read(filepath):
+            raise ValueError(f"Could not read the notification file '{filepath}'")
+        buttons = []
+        if 'buttons' in config_data:
+            buttons = [config_data['buttons'][key] for key in sorted(config_data['buttons'].keys())]
+        return cls(
+            path=filepath,
+            timestamp=int(config_data['date']['timestamp']),
+            type=config_data['notification'].get('type'),
+            title=config_data['message'].get('title', ''),
+            text=config_data['message'].get('text', ''),
+            buttons=buttons
+        )
+
+class DirectoryWatcher:
+    """Minimal inotify watch of one directory, using libc through ctypes."""
+
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_FROM = 0x00000040
+    IN_MOVED_TO = 0x00000080
+    IN_DELETE = 0x00000200
+    IN_DELETE_SELF = 0x00000400
+    IN_MOVE_SELF = 0x00000800
+    IN_Q_OVERFLOW = 0x00004000
+    IN_IGNORED = 0x00008000
+    EVENT_HEADER = struct.Struct("iIII")
+
+    def __init__(self, path):
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self.fd = libc.inotify_init1(os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        mask = self.IN_CLOSE_WRITE | self.IN_MOVED_FROM | self.IN_MOVED_TO | self.IN_DELETE | self.IN_DELETE_SELF | self.IN_MOVE_SELF
+        if libc.inotify_add_watch(self.fd, os.fsencode(path), mask) < 0:
+            errno = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(errno, f"inotify_add_watch failed for '{path}'")
+
+    def read(self, timeout):
+        """Wait up to timeout seconds and return a list of (mask, name) events."""
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return []
+        data = os.read(self.fd, 65536)
+        events = []
+        offset = 0
+        while offset < len(data):
+            _, mask, _, length = self.EVENT_HEADER.unpack_from(data, offset)
+            offset += self.EVENT_HEADER.size
+            name = data[offset:offset + length].rstrip(b"\0").decode(errors="replace")
+            offset += length
+            events.append((mask, name))
+        return events
+
+    def close(self):
+        os.close(self.fd)
+
+class NotificationScheduler:
+    """Scheduled notifications of the maintenance dir, ordered by timestamp.
+
+    The files are parsed once and kept current by an inotify watch of the
+    dir (or a stat of the dir when inotify is not available). Notifications
+    whose timestamp has passed are archived, deleted or kept according to
+    dcv_management_maintenance_expired_action.
+    """
+
+    FILE_PATTERN = "*.[0-9]*"
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.directory = None
+        self.directory_mtime = None
+        self.notifications = {}
+        self.heap = []
+        self.watching = False
+
+    def matches(self, name):
+        return fnmatch.fnmatch(name, self.FILE_PATTERN)
+
+    def ensure_loaded(self):
+        directory = get_settings().dcv_management_maintenance_dir
+        with self.lock:
+            if directory != self.directory:
+                self.directory = directory
+                self.rescan()
+                self.start_watch()
+            elif not self.watching:
+                # no inotify: rescan when the dir changed
+                try:
+                    directory_mtime = os.stat(directory).st_mtime_ns
+                except OSError:
+                    directory_mtime = None
+                if directory_mtime != self.directory_mtime:
+                    self.rescan()
+
+    def rescan(self):
+        with self.lock:
+            self.notifications = {}
+            self.heap = []
+            try:
+                self.directory_mtime = os.stat(self.directory).st_mtime_ns
+            except OSError:
+                self.directory_mtime = None
+            for filepath in glob.glob(os.path.join(self.directory, self.FILE_PATTERN)):
+                self.load(filepath)
+
+    def load(self, filepath):
+        try:
+            notification = Notification.from_file(filepath)
+        except Exception as e:
+            logging.error(f"[DCV Management Notification] Invalid notification file '{filepath}': {e}")
+            self.discard(filepath)
+            return None
+        with self.lock:
+            self.notifications[filepath] = notification
+            heapq.heappush(self.heap, (notification.timestamp, filepath))
+        return notification
+
+    def discard(self, filepath):
+        with self.lock:
+            # the heap entry is dropped lazily when it reaches the top
+            self.notifications.pop(filepath, None)
+
+    def start_watch(self):
+        directory = self.directory
+        try:
+            watcher = DirectoryWatcher(directory)
+        except Exception as e:
+            logging.warning(f"[DCV Management Notification] inotify is not available for '{directory}', checking the dir on each access: {e}")
+            self.watching = False
+            return
+        self.watching = True
+        threading.Thread(target=self.watch, args=(watcher, directory), name="notification-watcher", daemon=True).start()
+
+    def watch(self, watcher, directory):
+        try:
+            while self.directory == directory:
+                events = watcher.read(timeout=60)
+                with self.lock:
+                    if self.directory != directory:
+                        break
+                    for mask, name in events:
+                        if mask & (DirectoryWatcher.IN_DELETE_SELF | DirectoryWatcher.IN_MOVE_SELF | DirectoryWatcher.IN_IGNORED):
+                            # the dir itself is gone; the next access falls back to stat checks
+                            self.watching = False
+                            self.rescan()
+                            return
+                        if mask & DirectoryWatcher.IN_Q_OVERFLOW:
+                            self.rescan()
+                            continue
+                        if not name or not self.matches(name):
+                            continue
+                        filepath = os.path.join(directory, name)
+                        if mask & (DirectoryWatcher.IN_CLOSE_WRITE | DirectoryWatcher.IN_MOVED_TO):
+                            self.load(filepath)
+                        elif mask & (DirectoryWatcher.IN_DELETE | DirectoryWatcher.IN_MOVED_FROM):
+                            self.discard(filepath)
+                self.expire()
+        except Exception as e:
+            logging.error(f"[DCV Management Notification] Notification dir watch failed: {e}")
+            with self.lock:
+                self.watching = False
+        finally:
+            watcher.close()
+
+    def expire(self):
+        """Pop the notifications whose timestamp has passed and archive their files."""
+        now = datetime.now().timestamp()
+        expired = []
+        with self.lock:
+            while self.heap and self.heap[0][0] <= now:
+                timestamp, filepath = heapq.heappop(self.heap)
+                notification = self.notifications.get(filepath)
+                if notification is not None and notification.timestamp == timestamp:
+                    del self.notifications[filepath]
+                    expired.append(notification)
+        for notification in expired:
+            self.compact(notification)
+
+    def compact(self, notification):
+        action = get_settings().dcv_management_maintenance_expired_action
+        try:
+            if action == "delete":
+                os.remove(notification.path)
+            elif action == "archive":
+                archive_dir = os.path.join(os.path.dirname(notification.path), "archive")
+                os.makedirs(archive_dir, exist_ok=True)
+                os.replace(notification.path, os.path.join(archive_dir, os.path.basename(notification.path)))
+            else:
+                return
+            logging.info(f"[DCV Management Notification] Expired notification file '{notification.path}' was {action}d.")
+        except FileNotFoundError:
+            # already moved by another API worker
+            pass
+        except Exception as e:
+            logging.error(f"[DCV Management Notification] Failed to {action} expired notification file '{notification.path}': {e}")
+
+    def add(self, filepath):
+        self.ensure_loaded()
+        return self.load(filepath)
+
+    def active(self, filter_type=None):
+        """Notifications whose timestamp is still in the future, in timestamp order."""
+        self.ensure_loaded()
+        self.expire()
+        with self.lock:
+            notifications = sorted(self.notifications.values(), key=lambda notification: notification.timestamp)
+        if filter_type is not None:
+            notifications = [notification for notification in notifications if notification.type == filter_type]
+        return notifications
+
+notification_scheduler = NotificationScheduler()
+
+def notify_user(notification, user):
+    """Show one notification to one user and log the answer."""
+    title = notification.title
+    text = notification.text
 
     # Define a custom delimiter (ASCII Unit Separator) that is unlikely to be used in button texts.
     DELIMITER = "\x1f"
-    buttons_str = ""
-    if 'buttons' in config_data:
-        sorted_buttons = [config_data['buttons'][key] for key in sorted(config_data['buttons'].keys())]
-        buttons_str = DELIMITER.join(sorted_buttons)
+    buttons_str = DELIMITER.join(notification.buttons)
+
+    maint_timeout = get_settings().dcv_management_maintenance_timeout
+    cmd = [get_settings().dcv_notify_users_script, user, notification.type, title, text]
+    if buttons_str:
+        cmd.append(buttons_str)
+
+    result = prompt_executor.run(cmd, timeout=maint_timeout, env=gnome_session_environment(user))
+    answer = result.stdout.strip()
+    if result.timed_out:
+        logging.error(f"[DCV Management Notification] Notification for user '{user}' with title '{title}' and text '{text}' timed out after {maint_timeout} seconds with no user response.")
+        return {"status": "timeout", "answer": None}
+    elif result.returncode == 0:
+        logging.info(f"[DCV Management Notification] Notification sent to user '{user}' with title '{title}' and text '{text}'. User response: '{answer}'.")
+        return {"status": "answered", "answer": answer}
+    else:
+        logging.warning(f"[DCV Management Notification] Notification for user '{user}' with title '{title}' and text '{text}' returned error: {result.stderr.strip()}.")
+        return {"status": "error", "answer": None}
+
+class NotificationLedger:
+    """Append-only record of every notification shown to a user, in the shared store.
+
+    A (notification, user) pair is acknowledged once the user answered it;
+    timeouts and errors are recorded too, but the notification is shown
+    again next time.
+    """
+
+    def __init__(self, store):
+        self.store = store
+
+    def record(self, notification_id, user, status, answer):
+        self.store.connection().execute(
+            "INSERT INTO notification_deliveries (notification, user, status, answer, delivered) VALUES (?, ?, ?, ?, ?)",
+            (notification_id, user, status, answer, time.time())
+        )
+
+    def acknowledged(self, notification_ids, users):
+        """Return the set of (notification, user) pairs already answered."""
+        if not notification_ids or not users:
+            return set()
+        notification_marks = ",".join("?" * len(notification_ids))
+        user_marks = ",".join("?" * len(users))
+        rows = self.store.connection().execute(
+            f"SELECT DISTINCT notification, user FROM notification_deliveries WHERE status = 'answered' AND notification IN ({notification_marks}) AND user IN ({user_marks})",
+            list(notification_ids) + list(users)
+        ).fetchall()
+        return set(rows)
+
+    def is_acknowledged(self, notification_id, user):
+        return bool(self.acknowledged([notification_id], [user]))
+
+    def responses(self, notification_id):
+        connection = self.store.connection()
+        answers = {}
+        users = {}
+        # the latest answer of each user
+        for user, answer, delivered in connection.execute(
+            "SELECT user, answer, MAX(delivered) FROM notification_deliveries WHERE notification = ? AND status = 'answered' GROUP BY user",
+            (notification_id,)
+        ):
+            answers[answer] = answers.get(answer, 0) + 1
+            users[user] = {"answer": answer, "delivered": delivered}
+        attempts = dict(connection.execute(
+            "SELECT status, COUNT(*) FROM notification_deliveries WHERE notification = ? GROUP BY status",
+            (notification_id,)
+        ).fetchall())
+        return {"notification": notification_id, "answered": len(users), "answers": answers, "attempts": attempts, "users": users}
+
+notification_ledger = NotificationLedger(shared_store)
+
+def notification_id(notification):
+    return os.path.basename(notification.path)
+
+class NotificationDispatcher:
+    """Long-lived pool that shows notifications to users.
 
-    if now < file_timestamp:
-        settings_global = read_settings_conf()
+    Jobs are split in one task per (notification, user) and queued per
+    user. Users with pending tasks are served round-robin by at most
+    dcv_management_maintenance_max_concurrency threads, and a user is never
+    shown two dialogs at the same time (also across API worker processes,
+    through a lock file per user). Job progress is kept in the shared store
+    so any worker can answer a progress query.
+    """
+
+    JOB_MAX_AGE = 86400
+
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.user_queues = {}
+        self.ready_users = collections.deque()
+        self.busy_users = set()
+        self.jobs = {}
+        self.workers = 0
+
+    def submit(self, notifications, users):
+        job_id = uuid.uuid4().hex
         try:
-            maint_timeout = int(settings_global.get('dcv_management_maintenance_timeout', '20'))
+            acknowledged = notification_ledger.acknowledged([notification_id(notification) for notification in notifications], users)
         except Exception as e:
-            maint_timeout = 20
-        if target_user:
-            users = [target_user]
-        else:
-            users = get_all_gnome_sessions()
-
-        if users:
-            with ThreadPoolExecutor(max_workers=len(users)) as executor:
-                future_to_user = {}
-                for user in users:
-                    cmd = ["/usr/bin/dcv_notify_users", user, notif_type, title, text]
-                    if buttons_str:
-                        cmd.append(buttons_str)
-                    # Submit the process with the timeout enforced directly.
-                    future = executor.submit(
-                        subprocess.run,
-                        cmd,
-                        stdout=subprocess.PIPE,
-                        stderr=subprocess.PIPE,
-                        text=True,
-                        timeout=maint_timeout
-                    )
-                    future_to_user[future] = user
-
-                for future in as_completed(future_to_user):
-                    user = future_to_user[future]
-                    try:
-                        result = future.result()
-                        answer = result.stdout.strip()
-                        if result.returncode == 0:
-                            logging.info(f"[DCV Management Notification] Notification sent to user '{user}' with title '{title}' and text '{text}'. User response: '{answer}'.")
-                        else:
-                            logging.warning(f"[DCV Management Notification] Notification for user '{user}' with title '{title}' and text '{text}' returned error: {result.stderr.strip()}.")
-                    except subprocess.TimeoutExpired as toe:
-                        logging.error(f"[DCV Management Notification] Notification for user '{user}' with title '{title}' and text '{text}' timed out after {maint_timeout} seconds with no user response.")
-                    except Exception as e:
-                        logging.error(f"[DCV Management Notification] Error notifying user '{user}' with title '{title}' and text '{text}': {e}")
-        else:
-            logging.info("[DCV Management Notification] No active GNOME sessions found.")
+            logging.error(f"[DCV Management Notification] Failed to read the delivery ledger: {e}")
+            acknowledged = set()
+        tasks = [(user, notification) for user in users for notification in notifications if (notification_id(notification), user) not in acknowledged]
+        job = {
+            "id": job_id,
+            "status": "queued",
+            "created": time.time(),
+            "total": len(tasks),
+            "skipped": len(notifications) * len(users) - len(tasks),
+            "completed": 0,
+            "results": []
+        }
+        with self.condition:
+            self.jobs[job_id] = job
+            self.save(job)
+            for user, notification in tasks:
+                queue = self.user_queues.setdefault(user, collections.deque())
+                if not queue and user not in self.busy_users:
+                    self.ready_users.append(user)
+                queue.append((job_id, notification))
+            if job["total"] == 0:
+                self.finish(job)
+            self.ensure_workers()
+            self.condition.notify_all()
+        return job
+
+    def save(self, job):
+        try:
+            shared_store.set_job(job["id"], "notification", job)
+        except Exception as e:
+            logging.error(f"[DCV Management Notification] Failed to save the progress of job '{job['id']}': {e}")
+
+    def finish(self, job):
+        job["status"] = "completed"
+        self.save(job)
+        del self.jobs[job["id"]]
+
+    def queue_depth(self):
+        with self.condition:
+            return sum(len(queue) for queue in self.user_queues.values())
+
+    def ensure_workers(self):
+        limit = max(1, get_settings().dcv_management_maintenance_max_concurrency)
+        while self.workers < min(limit, len(self.ready_users)):
+            self.workers += 1
+            threading.Thread(target=self.work, name="notification-dispatcher", daemon=True).start()
+
+    def work(self):
+        while True:
+            with self.condition:
+                while not self.ready_users:
+                    if not self.condition.wait(timeout=60):
+                        # idle for a minute, let the thread go
+                        self.workers -= 1
+                        return
+                if self.workers > max(1, get_settings().dcv_management_maintenance_max_concurrency):
+                    self.workers -= 1
+                    return
+                user = self.ready_users.popleft()
+                job_id, notification = self.user_queues[user].popleft()
+                self.busy_users.add(user)
+                job = self.jobs[job_id]
+                job["status"] = "running"
+
+            try:
+                with self.user_lock(user):
+                    # answered meanwhile through another job
+                    if notification_ledger.is_acknowledged(notification_id(notification), user):
+                        result = {"status": "skipped", "answer": None}
+                    else:
+                        result = notify_user(notification, user)
+                        notification_ledger.record(notification_id(notification), user, result["status"], result["answer"])
+            except Exception as e:
+                logging.error(f"[DCV Management Notification] Error notifying user '{user}' with title '{notification.title}': {e}")
+                result = {"status": "error", "answer": None}
+
+            with self.condition:
+                self.busy_users.discard(user)
+                if self.user_queues[user]:
+                    self.ready_users.append(user)
+                    self.condition.notify()
+                else:
+                    del self.user_queues[user]
+                result.update({"user": user, "notification": notification_id(notification)})
+                job["results"].append(result)
+                job["completed"] += 1
+                if job["completed"] == job["total"]:
+                    self.finish(job)
+                else:
+                    self.save(job)
+
+    @contextlib.contextmanager
+    def user_lock(self, user):
+        lock_dir = os.path.join(get_settings().dcv_management_state_dir, "notify-locks")
+        os.makedirs(lock_dir, exist_ok=True)
+        with open(os.path.join(lock_dir, f"{sanitize_filename(user)}.lock"), "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            yield
+
+    def get_job(self, job_id):
+        with self.condition:
+            job = self.jobs.get(job_id)
+            if job is not None:
+                return json.loads(json.dumps(job))
+        return shared_store.get_job(job_id, "notification")
+
+notification_dispatcher = NotificationDispatcher()
+
+def dispatch_notifications(target_user=None, filter_type=None):
+    """Queue the active notifications for target_user (or every GNOME user) and return the job."""
+    notifications = notification_scheduler.active(filter_type)
+    if not notifications:
+        return None
+    if target_user:
+        users = [target_user]
     else:
-        logging.info(f"[DCV Management Notification] Notification file '{filepath}' will be skipped due due date.")
+        users = get_all_gnome_sessions()
+        if not users:
+            logging.info("[DCV Management Notification] No active GNOME sessions found.")
+    try:
+        shared_store.prune_jobs(NotificationDispatcher.JOB_MAX_AGE)
+    except Exception as e:
+        logging.error(f"[DCV Management Notification] Failed to prune old jobs: {e}")
+    return notification_dispatcher.submit(notifications, users)
 
 def delayed_process_notifications_for_user(target_user):
     # Wait for 20 seconds before processing notifications.
-    time.sleep(20)
-    settings = read_settings_conf()
-    maintenance_dir = settings.get('dcv_management_maintenance_dir', '')
-    files = glob.glob(os.path.join(maintenance_dir, "*.[0-9]*"))
-    if not files:
-        logging.info("No notification files found for delayed processing.")
-        return
-    for filepath in files:
-        process_notification_file(filepath, target_user)
+    threading.Timer(20, dispatch_notifications, args=(target_user,)).start()
 
 @app.route('/process-notification-auth', methods=['GET'])
 def process_notification_auth():
     username = request.args.get('username')
     if not username:
         return create_response("Missing username parameter", return_code=400)
-    threading.Thread(target=delayed_process_notifications_for_user, args=(username,)).start()
+    delayed_process_notifications_for_user(username)
     return create_response("Notification processing scheduled for user", return_code=200)
 
 @app.route('/process-notifications', methods=['GET'])
@@ -308,20 +1508,29 @@ def process_notifications():
     try:
         username = request.args.get('username')
         notif_type = request.args.get('type')
-        settings = read_settings_conf()
-        maintenance_dir = settings.get('dcv_management_maintenance_dir', '')
-        files = glob.glob(os.path.join(maintenance_dir, "*.[0-9]*"))
-        if not files:
+        job = dispatch_notifications(username, notif_type)
+        if job is None:
             return create_response("No notifications found", return_code=200)
-        with ThreadPoolExecutor(max_workers=5) as executor:
-            futures = {executor.submit(process_notification_file, f, username, notif_type): f for f in files}
-            for future in as_completed(futures):
-                pass
-        return create_response("Processing completed", return_code=200)
+        return create_response({"job_id": job["id"], "total": job["total"]}, stdout=job["id"], return_code=200)
     except Exception as e:
         logging.error(f"Error processing notifications: {e}")
         return create_response(str(e), return_code=500)
 
+@app.route('/notifications/<notification_id>/responses', methods=['GET'])
+def get_notification_responses(notification_id):
+    try:
+        responses = notification_ledger.responses(notification_id)
+    except Exception as e:
+        return create_response("Error: Failed to read the notification responses.", stderr=str(e), return_code=500)
+    return create_response(responses, return_code=200)
+
+@app.route('/notification-jobs/<job_id>', methods=['GET'])
+def get_notification_job(job_id):
+    job = notification_dispatcher.get_job(job_id)
+    if job is None:
+        return create_response(f"Notification job '{job_id}' not found.", return_code=404)
+    return create_response(job, return_code=200)
+
 @app.route('/schedule-notification', methods=['POST'])
 def schedule_notification():
     try:
@@ -371,13 +1580,13 @@ def schedule_notification():
 
         safe_title = sanitize_filename(title)
         filename = f"{safe_title}.{timestamp}"
-        settings = read_settings_conf()
-        maintenance_dir = settings.get('dcv_management_maintenance_dir', '')
+        maintenance_dir = get_settings().dcv_management_maintenance_dir
 
         filepath = os.path.join(maintenance_dir, filename)
 
         with open(filepath, 'w') as f:
             config_data.write(f)
+        notification_scheduler.add(filepath)
 
         return create_response("Notification scheduled", stdout=filename, return_code=200)
     except ValueError as ve:
@@ -394,33 +1603,18 @@ def remove_permission():
     if not collab_owner_username or not collab_session_name or not collab_del_username:
         return create_response("Missing one or more parameters: 'collab_owner_username', 'collab_session_name', 'collab_del_username'.", return_code=400)
 
-    settings = read_settings_conf()
-    session_perm_dir = settings.get('dcv_collab_sessions_permissions_dir', '')
-    perm_file_path = f"{session_perm_dir}{collab_owner_username}.perm"
-    
-    if not os.path.isfile(perm_file_path):
+    perm_file_path = get_permission_file_path(collab_session_name)
+
+    if not perm_file_path or not os.path.isfile(perm_file_path):
         return create_response(f"Permission file '{perm_file_path}' does not exist.", return_code=404)
 
     try:
-        with open(perm_file_path, 'r') as file:
-            lines = file.readlines()
-
-        with open(perm_file_path, 'w') as file:
-            for line in lines:
-                if line.strip() != f"{collab_del_username} allow display":
-                    file.write(line)
-
-        command = [
-            "sudo",
-            "dcv",
-            "set-permissions",
-            "--session",
+        changed, result = permission_manager.change(
             collab_session_name,
-            "--file",
-            perm_file_path
-        ]
-
-        result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+            perm_file_path,
+            lambda permission_file: (permission_file, permission_file is not None and permission_file.remove_permission(f"{collab_del_username} allow display"))
+        )
+        approval_broker.revoke(collab_session_name, collab_del_username)
 
         if result.returncode != 0:
             return create_response(
@@ -431,7 +1625,7 @@ def remove_permission():
                 )
         
         return create_response(
-            message="Removed permission for '{collab_del_username}' successfully.",
+            message=f"Removed permission for '{collab_del_username}' successfully.",
             stdout=result.stdout,
             stderr=result.stderr,
             return_code=200
@@ -444,6 +1638,388 @@ def remove_permission():
             return_code=500
         )
 
+def parse_permission_operation(data):
+    """Validate a bulk permission operation. Returns (action, session, user, permission, owner)."""
+    action = data.get('action')
+    session = data.get('session')
+    user = data.get('user')
+    permission = data.get('permission', 'display')
+    owner = data.get('owner')
+
+    if action not in ("add", "remove", "replace"):
+        raise ValueError("action must be one of: add, remove, replace.")
+    if not session or not user:
+        raise ValueError("Missing one or more parameters: 'session', 'user'.")
+    if not re.match(r'^[\w.@-]+$', user) or (owner and not re.match(r'^[\w.@-]+$', owner)):
+        raise ValueError("Invalid user name.")
+    if not re.match(r'^\w[\w.@-]*$', session):
+        raise ValueError("Invalid session name.")
+    if permission not in ("display", "builtin"):
+        raise ValueError("permission must be one of: display, builtin.")
+    return action, session, user, permission, owner
+
+def apply_permission_operations(permission_file, operations, results):
+    """Apply the operations of one session to its parsed permission file, storing each result by position."""
+    session_changed = False
+    for position, (action, session, user, permission, owner) in operations:
+        if permission_file is None:
+            if not owner:
+                results[position] = {"session": session, "user": user, "action": action, "message": "Permission file does not exist and no 'owner' was given to create it.", "return_code": 404}
+                continue
+            permission_file = PermissionFile.template(owner)
+        line = f"{user} allow {permission}"
+        if action == "add":
+            changed = permission_file.add_permission(line)
+        elif action == "remove":
+            changed = permission_file.remove_permission(line)
+        else:
+            changed = permission_file.replace_permissions(user, [line])
+        session_changed = session_changed or changed
+        results[position] = {"session": session, "user": user, "action": action, "changed": changed, "return_code": 200}
+    return permission_file, session_changed
+
+@app.route('/permissions/bulk', methods=['POST'])
+def bulk_permissions():
+    data = request.get_json(silent=True) or {}
+    operations = data.get('operations')
+    if not isinstance(operations, list) or not operations:
+        return create_response("Missing 'operations' list.", return_code=400)
+
+    results = [None] * len(operations)
+    sessions = {}
+    invalid = False
+    for position, entry in enumerate(operations):
+        entry = entry if isinstance(entry, dict) else {}
+        try:
+            operation = parse_permission_operation(entry)
+        except Exception as e:
+            results[position] = {"session": entry.get('session'), "user": entry.get('user'), "action": entry.get('action'), "message": str(e), "return_code": 400}
+            invalid = True
+            continue
+        sessions.setdefault(operation[1], []).append((position, operation))
+
+    if not invalid and not get_settings().dcv_collab_sessions_permissions_dir:
+        return create_response("Session permissions directory is not configured.", return_code=500)
+
+    # a session without permission file needs an owner to create it, before its first operation
+    for session, session_operations in ([] if invalid else sessions.items()):
+        if os.path.isfile(get_permission_file_path(session)):
+            continue
+        for position, (action, _, user, _, owner) in session_operations:
+            if owner:
+                break
+            results[position] = {"session": session, "user": user, "action": action, "message": "Permission file does not exist and no 'owner' was given to create it.", "return_code": 404}
+            invalid = True
+
+    # the operations are validated together: nothing is applied if one of them is invalid
+    if invalid:
+        return create_response(results, return_code=400)
+
+    def apply(session, session_operations):
+        positions = [position for position, _ in session_operations]
+        try:
+            # each session file is written and applied once for all of its operations
+            changed, result = permission_manager.change(
+                session,
+                get_permission_file_path(session),
+                lambda permission_file: apply_permission_operations(permission_file, session_operations, results)
+            )
+        except Exception as e:
+            for position in positions:
+                if results[position] is None or results[position]["return_code"] == 200:
+                    results[position] = {"session": session, "user": operations[position].get('user'), "action": operations[position].get('action'), "message": "Error writing the permission file.", "stderr": str(e), "return_code": 500}
+            return
+        for _, (action, _, user, _, _) in session_operations:
+            if action != "add":
+                approval_broker.revoke(session, user)
+        for position in positions:
+            if results[position]["return_code"] == 200 and result.returncode != 0:
+                results[position].update({"message": "Error executing set-permissions.", "stderr": result.stderr, "return_code": 500})
+
+    with ThreadPoolExecutor(max_workers=min(len(sessions), 16)) as executor:
+        for future in [executor.submit(apply, session, session_operations) for session, session_operations in sessions.items()]:
+            future.result()
+
+    return create_response(results, return_code=200)
+
+def request_collab_approval(collab_session_owner, collab_username, number_of_connections, collab_session_name):
+    """Ask the collab session owner to approve collab_username and grant the permission if approved.
+
+    Returns (approved, error); error is None or a dict with message, stdout,
+    stderr and return_code describing why the approval could not be done.
+    """
+    script_perm_prompt_path = get_settings().dcv_collab_prompt_script
+
+    if not os.path.isfile(script_perm_prompt_path):
+        return False, {"message": "Approval script not found on server.", "stdout": None, "stderr": None, "return_code": 500}
+
+    settings = get_settings()
+    timeout = settings.dcv_collab_prompt_timeout
+    session_auto_creation_by_dcv = settings.session_auto_creation_by_dcv
+
+    if not is_positive_integer(timeout):
+        timeout = 23  # Fallback to default
+
+    if not session_auto_creation_by_dcv and not collab_session_name:
+        collab_session_name = get_first_session_id()
+
+    # zenity closes the dialog after timeout seconds, give the script some extra time to finish
+    result = prompt_executor.run([script_perm_prompt_path, collab_session_owner, collab_username, str(timeout)], timeout=timeout + 10, env=gnome_session_environment(collab_session_owner))
+
+    if result.returncode != 0:
+        return False, {"message": "Error executing approval script.", "stdout": result.stdout, "stderr": result.stderr.strip(), "return_code": 500}
+
+    if result.stdout.strip().lower() != "true":
+        return False, None
+
+    if not session_auto_creation_by_dcv:
+        if collab_session_owner == collab_username:
+            new_line = f"{collab_username} allow builtin"
+        else:
+            new_line = f"{collab_username} allow display"
+    else:
+        if number_of_connections > 0:
+            new_line = f"{collab_username} allow display"
+        else:
+            new_line = f"{collab_username} allow builtin"
+
+    response, status_code = manage_permission_file(collab_session_owner, collab_session_name, new_permission_line=new_line)
+    if status_code != 200:
+        response = response.get_json()
+        return False, {"message": response["message"], "stdout": response.get("stdout", ""), "stderr": response.get("stderr", ""), "return_code": status_code}
+
+    return True, None
+
+def process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+class ApprovalBroker:
+    """Collab approvals run in the background, one prompt per (owner, collaborator, session).
+
+    submit() returns the id of the approval; a request for the same owner,
+    collaborator and session while its prompt is still open gets the same
+    id instead of a second dialog. At most dcv_collab_max_prompts_per_owner
+    prompts are open for the same owner, the other approvals wait queued.
+    The approvals are kept in the shared store, so any API worker can
+    answer for them; the ones of a worker that exited are ignored.
+
+    An approval granted less than dcv_collab_approval_cache_ttl seconds ago
+    for the same session, owner and collaborator is returned again without
+    a prompt, until the session is closed or its owner changes.
+    """
+
+    PENDING = ("queued", "prompting")
+    MAX_AGE = 86400
+
+    def __init__(self, store):
+        self.store = store
+        self.lock = threading.Lock()
+        self.events = {}
+        # notified when a prompt of this process finishes and frees its slot
+        self.slot_freed = threading.Condition()
+
+    def cached(self, owner, collaborator, session):
+        ttl = get_settings().dcv_collab_approval_cache_ttl
+        if not ttl:
+            return None
+        row = self.store.connection().execute(
+            "SELECT id FROM approvals WHERE session = ? AND owner = ? AND collaborator = ? AND status = 'approved' AND updated > ? ORDER BY updated DESC LIMIT 1",
+            (session, owner, collaborator, time.time() - ttl)
+        ).fetchone()
+        return self.get(row[0]) if row is not None else None
+
+    def revoke(self, session, collaborator=None):
+        """Forget the approvals granted for the session (or one collaborator of it), e.g. when it is closed or its owner changes."""
+        if collaborator is None:
+            self.store.connection().execute("UPDATE approvals SET status = 'revoked', updated = ? WHERE session = ? AND status = 'approved'", (time.time(), session))
+        else:
+            self.store.connection().execute("UPDATE approvals SET status = 'revoked', updated = ? WHERE session = ? AND collaborator = ? AND status = 'approved'", (time.time(), session, collaborator))
+
+    def submit(self, owner, collaborator, session, connections):
+        """Returns (approval, coalesced); approval["cached"] is True for a recent approval returned again."""
+        approval = self.cached(owner, collaborator, session)
+        if approval is not None:
+            approval["cached"] = True
+            return approval, True
+        now = time.time()
+        with self.store.transaction() as connection:
+            rows = connection.execute(
+                "SELECT id, pid FROM approvals WHERE owner = ? AND collaborator = ? AND session = ? AND status IN ('queued', 'prompting') ORDER BY created",
+                (owner, collaborator, session)
+            ).fetchall()
+            for approval_id, pid in rows:
+                if process_alive(pid):
+                    coalesced_id = approval_id
+                    break
+                connection.execute("UPDATE approvals SET status = 'error', result = ?, updated = ? WHERE id = ?", (json.dumps({"approved": False, "error": {"message": "The API worker running the approval exited.", "stdout": None, "stderr": None, "return_code": 500}}), now, approval_id))
+            else:
+                coalesced_id = None
+            if coalesced_id is None:
+                approval_id = uuid.uuid4().hex
+                connection.execute(
+                    "INSERT INTO approvals (id, owner, collaborator, session, connections, status, result, pid, created, updated) VALUES (?, ?, ?, ?, ?, 'queued', NULL, ?, ?, ?)",
+                    (approval_id, owner, collaborator, session, connections, os.getpid(), now, now)
+                )
+                connection.execute("DELETE FROM approvals WHERE updated < ? AND status NOT IN ('queued', 'prompting')", (now - self.MAX_AGE,))
+        if coalesced_id is not None:
+            approval = self.get(coalesced_id)
+            approval["cached"] = False
+            return approval, True
+        with self.lock:
+            self.events[approval_id] = threading.Event()
+        threading.Thread(target=self.run, args=(approval_id, owner, collaborator, session, connections), name="collab-approval", daemon=True).start()
+        approval = self.get(approval_id)
+        approval["cached"] = False
+        return approval, False
+
+    def get(self, approval_id):
+        row = self.store.connection().execute(
+            "SELECT id, owner, collaborator, session, status, result, created, updated FROM approvals WHERE id = ?", (approval_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        approval = {"id": row[0], "owner": row[1], "collaborator": row[2], "session": row[3], "status": row[4], "created": row[6], "updated": row[7]}
+        approval.update(json.loads(row[5]) if row[5] else {"approved": None, "error": None})
+        return approval
+
+    def wait(self, approval_id, timeout):
+        """The approval, after waiting up to timeout seconds for its prompt to finish."""
+        deadline = time.monotonic() + timeout
+        while True:
+            approval = self.get(approval_id)
+            if approval is None or approval["status"] not in self.PENDING:
+                return approval
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return approval
+            with self.lock:
+                event = self.events.get(approval_id)
+            # approvals submitted in another worker process are polled
+            if event is not None:
+                event.wait(min(remaining, 1))
+            else:
+                time.sleep(min(remaining, 0.25))
+
+    def acquire_prompt_slot(self, approval_id, owner, timeout):
+        """Wait up to timeout seconds until the approval is the oldest queued one of the owner and a prompt slot is free.
+
+        Returns False if no slot was free in time.
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            limit = max(1, get_settings().dcv_collab_max_prompts_per_owner)
+            with self.store.transaction() as connection:
+                rows = connection.execute("SELECT id, status, pid FROM approvals WHERE owner = ? AND status IN ('queued', 'prompting') ORDER BY created", (owner,)).fetchall()
+                rows = [(row_id, status) for row_id, status, pid in rows if process_alive(pid)]
+                prompting = sum(1 for _, status in rows if status == "prompting")
+                first_queued = next((row_id for row_id, status in rows if status == "queued"), None)
+                if prompting < limit and first_queued == approval_id:
+                    connection.execute("UPDATE approvals SET status = 'prompting', updated = ? WHERE id = ?", (time.time(), approval_id))
+                    return True
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            # the slots freed by other worker processes are not notified, check again every second
+            with self.slot_freed:
+                self.slot_freed.wait(min(remaining, 1))
+
+    def run(self, approval_id, owner, collaborator, session, connections):
+        try:
+            prompt_timeout = collab_prompt_timeout()
+            if not self.acquire_prompt_slot(approval_id, owner, approval_wait_timeout() - prompt_timeout):
+                # fail closed: the login is denied rather than left waiting for a prompt
+                approved, error = False, {"message": "The session owner has too many open prompts, try again later.", "stdout": None, "stderr": None, "return_code": 504}
+            else:
+                # request_collab_approval builds Flask responses for the permission file changes
+                with app.app_context():
+                    approved, error = request_collab_approval(owner, collaborator, connections, session)
+            status = "error" if error is not None else ("approved" if approved else "denied")
+            result = {"approved": approved, "error": error}
+        except Exception as e:
+            logging.error(f"[DCV Management Collab] Approval of user '{collaborator}' by '{owner}' failed: {e}")
+            status = "error"
+            result = {"approved": False, "error": {"message": "Error.", "stdout": None, "stderr": str(e), "return_code": 500}}
+        try:
+            self.store.connection().execute("UPDATE approvals SET status = ?, result = ?, updated = ? WHERE id = ?", (status, json.dumps(result), time.time(), approval_id))
+        except Exception as e:
+            logging.error(f"[DCV Management Collab] Failed to save the approval '{approval_id}': {e}")
+        with self.lock:
+            event = self.events.pop(approval_id, None)
+        if event is not None:
+            event.set()
+        with self.slot_freed:
+            self.slot_freed.notify_all()
+
+approval_broker = ApprovalBroker(shared_store)
+
+def resolve_collab_session_name(collab_session_name):
+    if not collab_session_name and not get_settings().session_auto_creation_by_dcv:
+        return get_first_session_id() or ""
+    return collab_session_name or ""
+
+def collab_prompt_timeout():
+    timeout = get_settings().dcv_collab_prompt_timeout
+    if not is_positive_integer(timeout):
+        timeout = 23
+    return timeout
+
+def approval_wait_timeout():
+    # the prompt itself, after waiting up to the prompt timeout plus 20 seconds for a slot of the owner
+    return collab_prompt_timeout() * 2 + 20
+
+def approve_collab_login(collab_session_owner, collab_username, number_of_connections, collab_session_name):
+    """Submit an approval and wait for its result. Returns (approved, error) like request_collab_approval."""
+    approval, coalesced = approval_broker.submit(collab_session_owner, collab_username, resolve_collab_session_name(collab_session_name), number_of_connections)
+    approval = approval_broker.wait(approval["id"], approval_wait_timeout())
+    if approval["status"] in ApprovalBroker.PENDING:
+        return False, {"message": "The approval did not finish in time.", "stdout": None, "stderr": None, "return_code": 504}
+    return bool(approval["approved"]), approval["error"]
+
+@app.route('/approvals', methods=['POST'])
+def submit_approval():
+    collab_session_owner = request.args.get('collab_session_owner')
+    collab_session_name = request.args.get('session_id', '').strip()
+    collab_username = request.args.get('collab_username')
+    number_of_connections = request.args.get('number_of_connections', '1')
+
+    if not collab_session_owner or not collab_username or not number_of_connections.isdigit():
+        return create_response("Missing 'collab_session_owner' or 'collab_username' or 'number_of_connections' in request.", return_code=400)
+
+    try:
+        approval, coalesced = approval_broker.submit(collab_session_owner, collab_username, resolve_collab_session_name(collab_session_name), int(number_of_connections))
+    except Exception as e:
+        return create_response("Error: Failed to submit the approval.", stderr=str(e), return_code=500)
+    approval["coalesced"] = coalesced
+    return create_response(approval, stdout=approval["id"], return_code=202)
+
+@app.route('/approvals/<approval_id>', methods=['GET'])
+def get_approval(approval_id):
+    try:
+        wait = min(float(request.args.get('wait', '0')), 60)
+    except ValueError:
+        return create_response("wait must be a number of seconds.", return_code=400)
+    approval = approval_broker.wait(approval_id, max(wait, 0))
+    if approval is None:
+        return create_response(f"Approval '{approval_id}' not found.", return_code=404)
+    return create_response(approval, return_code=200)
+
+@app.route('/approvals/<approval_id>/result', methods=['GET'])
+def get_approval_result(approval_id):
+    approval = approval_broker.wait(approval_id, approval_wait_timeout())
+    if approval is None:
+        return create_response(f"Approval '{approval_id}' not found.", return_code=404)
+    if approval["status"] in ApprovalBroker.PENDING:
+        return create_response(approval, return_code=202)
+    if approval["error"] is not None:
+        return create_response(approval["error"]["message"], stdout=approval["error"]["stdout"], stderr=approval["error"]["stderr"], return_code=approval["error"]["return_code"])
+    return create_response(approval["approved"], return_code=200)
+
 @app.route('/approve-login', methods=['POST'])
 def approve_login():
     try:
@@ -460,108 +2036,16 @@ def approve_login():
                 return_code=400
             )
 
-        script_perm_prompt_path = "/usr/bin/dcv_collab_prompt"
-
-        if not os.path.isfile(script_perm_prompt_path):
+        approved, error = approve_collab_login(collab_session_owner, collab_username, number_of_connections, collab_session_name)
+        if error is not None:
             return create_response(
-                message="Approval script not found on server.",
-                stdout=None,
-                stderr=None,
-                return_code=500
-            )
-
-        settings = read_settings_conf()
-        timeout = settings.get('dcv_collab_prompt_timeout', '')
-        session_auto_creation_by_dcv = settings.get('session_auto_creation_by_dcv', '').strip()
-
-        if not is_positive_integer(timeout):
-            timeout = 23  # Fallback to default
-
-        if session_auto_creation_by_dcv.strip().lower() == "false":
-            if not collab_session_name:
-                # get_first_session returns a tuple: (Flask response, status_code)
-                resp, _ = get_first_session()
-                data = json.loads(resp.get_data(as_text=True))
-                collab_session_name = data.get("message")
-
-            env = os.environ.copy()
-            result = subprocess.run(
-                [script_perm_prompt_path, collab_session_owner, collab_username, str(timeout)],
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                text=True,
-                env=env,
-                shell=False 
-            )
-
-            if result.returncode != 0:
-                return create_response(
-                    message="Error executing approval script.",
-                    stdout=result.stdout,
-                    stderr=result.stderr.strip(),
-                    return_code=500
-                )
-
-            approval = result.stdout.strip().lower()
-
-            if approval == "true":
-                if collab_session_owner == collab_username:
-                    new_line = f"{collab_username} allow bultin"
-                else:
-                    new_line = f"{collab_username} allow display"
-                
-                response, status_code = manage_permission_file(collab_session_owner, collab_session_name, new_permission_line=new_line)
-                if status_code != 200:
-                    return create_response(
-                        message=response["message"],
-                        stdout=response.get("stdout", ""),
-                        stderr=response.get("stderr", ""),
-                        return_code=status_code
-                    )
-                
-                return create_response(True, return_code=200)
-            else:
-                return create_response(False, return_code=200)
-        else:
-            env = os.environ.copy()
-
-            result = subprocess.run(
-                [script_perm_prompt_path, collab_session_owner, collab_username, str(timeout)],
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                text=True,
-                env=env, 
-                shell=False
+                message=error["message"],
+                stdout=error["stdout"],
+                stderr=error["stderr"],
+                return_code=error["return_code"]
             )
 
-            if result.returncode != 0:
-                return create_response(
-                    message="Error executing approval script.",
-                    stdout=result.stdout,
-                    stderr=result.stderr,
-                    return_code=500
-                )
-
-            approval = result.stdout.strip().lower()
-
-            if approval == "true":
-                if number_of_connections > 0:
-                    new_line = f"{collab_username} allow display"
-                else:
-                    new_line = f"{collab_username} allow builtin"
-                
-                response, status_code = manage_permission_file(collab_session_owner, collab_session_name, new_permission_line=new_line)
-                if status_code != 200:
-                    return create_response(
-                        message=response["message"],
-                        stdout=response.get("stdout", ""),
-                        stderr=response.get("stderr", ""),
-                        return_code=status_code
-                    )
-                else:
-                    return create_response(True, return_code=200)
-            else:
-                return create_response(False, return_code=200)
+        return create_response(approved, return_code=200)
     except Exception as e:
         return create_response(
             message="Error.",
@@ -573,22 +2057,19 @@ def approve_login():
 @app.route('/check-collab-settings', methods=['GET'])
 def check_collab_settings():
     try:
-        settings = read_settings_conf()
-        dcv_collab = settings.get('dcv_collab', '').lower()
-        dcv_collab_session_name = settings.get('dcv_collab_session_name', '').strip()
-        dcv_collab_session_type = settings.get('session_type', '').strip()
-        session_auto_creation_by_dcv = settings.get('session_auto_creation_by_dcv', '').strip()
+        settings = get_settings()
+        dcv_collab = settings.dcv_collab
+        dcv_collab_session_name = settings.dcv_collab_session_name
+        dcv_collab_session_type = settings.session_type
+        session_auto_creation_by_dcv = settings.session_auto_creation_by_dcv
 
-        if dcv_collab == 'true':
+        if dcv_collab:
             # Check if the session exists
             if session_exists(dcv_collab_session_name):
                 return create_response({"collab_enabled": True, "session_name": dcv_collab_session_name, "session_type": dcv_collab_session_type, "session_auto_creation_by_dcv": session_auto_creation_by_dcv})
             else:
                 if not dcv_collab_session_name:
-                    # get_first_session returns a tuple: (Flask response, status_code)
-                    resp, _ = get_first_session()
-                    data = json.loads(resp.get_data(as_text=True))
-                    dcv_collab_session_name = data.get("message")
+                    dcv_collab_session_name = get_first_session_id()
 
                 if dcv_collab_session_name:
                     return create_response({"collab_enabled": True, "session_name": dcv_collab_session_name, "session_type": dcv_collab_session_type, "session_auto_creation_by_dcv": session_auto_creation_by_dcv})
@@ -611,19 +2092,18 @@ def get_session_owner():
         if not session_name:
             return create_response("Missing session_name parameter. Please provide a session_name in the query string.", return_code=400)
 
-        command = " ".join(["/usr/bin/dcv", "list-sessions", "--json"])
-        process = subprocess.Popen(command, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        output, error = process.communicate()
+        result = session_inventory.get()
 
-        if process.returncode != 0:
-            return create_response("Error executing dcv list-sessions", stderr=error.decode(), return_code=500)
+        if result["returncode"] != 0:
+            return create_response("Error executing dcv list-sessions", stderr=result["stderr"], return_code=500)
 
-        sessions = json.loads(output.decode('utf-8'))
-        
-        for session in sessions:
-            if session.get('id') == session_name:
-                owner = session.get('owner')
-                return create_response({"session_name": session_name, "owner": owner})
+        index = result["data"]
+        if index is None:
+            return create_response("Error: Failed to parse JSON output", stderr=result["parse_error"], return_code=500)
+
+        session = index.get(session_name)
+        if session is not None:
+            return create_response({"session_name": session_name, "owner": session.owner})
 
         return create_response(f"Session '{session_name}' not found.", return_code=404)
     
@@ -635,21 +2115,30 @@ def get_session_owner():
             return_code=500
         )
     
+def get_collab_session_owner():
+    return shared_store.get("collab_session_owner", "")
+
+def set_collab_session_owner(session_owner, session_id):
+    collab_session_owner = session_owner.strip()
+    # the permission file is created again, so the previous approvals are not valid anymore
+    approval_broker.revoke(session_id)
+    shared_store.set("collab_session_owner", collab_session_owner)
+
+    response, status_code = manage_permission_file(collab_session_owner, session_id, overwrite=True)
+    return response.get_json(), status_code
+
 @app.route('/collab-set-session-owner', methods=['POST'])
 def collab_set_session_owner():
-    global collab_session_owner
     session_id = request.args.get('session_id')
     session_owner = request.args.get('session_owner')
 
-    if not session_id and not session_owner:
-        return create_response("Missing owner or session_owner parameter.", return_code=400)
-
-    collab_session_owner = session_owner.strip()
+    if not session_id or not session_owner:
+        return create_response("Missing session_id or session_owner parameter.", return_code=400)
 
-    response, status_code = manage_permission_file(collab_session_owner, session_id, overwrite=True)
+    response, status_code = set_collab_session_owner(session_owner, session_id)
     
     return create_response(
-        message={"collab_session_owner": collab_session_owner, "file_response": response["message"]},
+        message={"collab_session_owner": get_collab_session_owner(), "file_response": response["message"]},
         stdout=response.get("stdout",""),
         stderr=response.get("stderr",""),
         return_code=status_code
@@ -657,40 +2146,310 @@ def collab_set_session_owner():
 
 @app.route('/collab-get-session-owner', methods=['GET'])
 def collab_get_session_owner():
-    global session_count_by_owner
+    return create_response(
+        message={"collab_session_owner": get_collab_session_owner()},
+        stdout=None,
+        stderr=None,
+        return_code=200
+    )
+
+def get_collab_session_name(settings, index):
+    if settings.dcv_collab_session_name:
+        return settings.dcv_collab_session_name
+    first = index.first()
+    return first.id if first is not None else None
+
+def authorize_pam_login(username):
+    """Decide whether a DCV PAM login is authorized, using one session inventory snapshot.
+
+    Returns (exit_code, reason). Exit code 0 authorizes the login, the other
+    codes are the ones returned by dcv_local_sessions when it did the same
+    checks with one HTTP call per step.
+    """
+    settings = get_settings()
+    index = get_session_index()
+    if index is None:
+        return 12, "Failed to list the DCV sessions."
+
+    # collab session created by the DCV server itself: the first user to connect is the owner
+    if settings.dcv_collab and settings.session_auto_creation_by_dcv:
+        session = index.first()
+        if session is None:
+            return 14, "No session created by the DCV server was found."
+
+        if session.num_connections == 0:
+            set_collab_session_owner(username, session.id)
+            return 0, "First user connected to the collab session, set as session owner."
+
+        collab_session_owner = get_collab_session_owner()
+        if username == collab_session_owner:
+            return 0, "User is the collab session owner."
+
+        approved, error = approve_collab_login(collab_session_owner, username, session.num_connections, session.id)
+        if approved:
+            return 0, "Approved by the collab session owner."
+        return 18, error["message"] if error else "Denied by the collab session owner."
+
+    if not settings.dcv_collab:
+        if index.get(username) is not None:
+            return 0, "Session already exists."
+        status, output, error = create_owner_session(username)
+        if status == "error":
+            return 1, f"Failed to create the session: {error}"
+        return 0, "Session created." if status == "created" else "Session already exists."
+
+    collab_session_name = get_collab_session_name(settings, index)
+    session = index.get(collab_session_name) if collab_session_name else None
+
+    # the collab session is closed, so the user gets an own session
+    if session is None:
+        status, output, error = create_owner_session(username)
+        if status == "error":
+            return 2, f"Failed to create the session: {error}"
+        return 0, "Session created." if status == "created" else "Session already exists."
+
+    if session.owner and username.lower() == session.owner.lower():
+        return 0, "User is the collab session owner."
+
+    approved, error = approve_collab_login(session.owner, username, session.num_connections, session.id)
+    if approved:
+        return 0, "Approved by the collab session owner."
+    return 3, error["message"] if error else "Denied by the collab session owner."
+
+@app.route('/pam/authorize', methods=['GET', 'POST'])
+def pam_authorize():
+    username = request.args.get('username')
+    if not username:
+        return create_response("Missing username parameter", return_code=400)
+
+    try:
+        exit_code, reason = authorize_pam_login(username)
+    except Exception as e:
+        return create_response(
+            message={"username": username, "approved": False, "exit_code": 255, "reason": "Error."},
+            stdout=None,
+            stderr=str(e),
+            return_code=500
+        )
+
+    if exit_code == 0:
+        delayed_process_notifications_for_user(username)
+    else:
+        logging.info(f"[DCV Management PAM] Login of user '{username}' denied with exit code {exit_code}: {reason}")
 
     return create_response(
-        message={"collab_session_owner": collab_session_owner},
+        message={"username": username, "approved": exit_code == 0, "exit_code": exit_code, "reason": reason},
         stdout=None,
         stderr=None,
         return_code=200
     )
 
-@app.route('/request_token', methods=['POST'])
-def execute_ssh_command():
-    data = request.get_json()
+class PooledSshClient:
+    """SSHClient given to the functions of SshConnectionPool.run, recording if a remote command was started."""
+
+    def __init__(self, client):
+        self.client = client
+        self.started = False
+
+    def exec_command(self, command, bufsize=-1, timeout=None):
+        # same steps as SSHClient.exec_command; a failure to open the channel means nothing ran on the host
+        channel = self.client.get_transport().open_session(timeout=timeout)
+        channel.settimeout(timeout)
+        self.started = True
+        channel.exec_command(command)
+        return channel.makefile_stdin("wb", bufsize), channel.makefile("r", bufsize), channel.makefile_stderr("r", bufsize)
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+class SshConnectionPool:
+    """Reusable paramiko connections keyed by (host, port, user, key fingerprint).
+
+    Idle connections are kept with keepalives for ssh_pool_idle_timeout
+    seconds, and at most ssh_pool_max_per_host connections (idle or in use)
+    are open to the same host and port.
+    """
+
+    KEY_CACHE_SIZE = 128
+
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.idle = {}  # pool key -> list of (client, last used)
+        self.open_per_host = {}
+        self.keys = collections.OrderedDict()
+        self.janitor = None
+
+    def load_key(self, private_key):
+        """Parse private_key once and reuse the RSAKey for later requests."""
+        digest = hashlib.sha256(private_key.encode()).hexdigest()
+        with self.condition:
+            key = self.keys.get(digest)
+            if key is not None:
+                self.keys.move_to_end(digest)
+                return key
+        key = paramiko.RSAKey.from_private_key(StringIO(private_key))
+        with self.condition:
+            self.keys[digest] = key
+            while len(self.keys) > self.KEY_CACHE_SIZE:
+                self.keys.popitem(last=False)
+        return key
+
+    def stats(self):
+        with self.condition:
+            return {
+                "open": sum(self.open_per_host.values()),
+                "idle": sum(len(clients) for clients in self.idle.values())
+            }
+
+    def run(self, host, port, user, private_key, function, timeout=30):
+        """Call function(client) with a pooled connection.
+
+        If a reused connection turns out to be dead before a remote command
+        was started, it is dropped and the call is retried on a new
+        connection. Once a command was sent it is never run again, as it may
+        have run on the host (e.g. issued a token).
+        """
+        key = self.load_key(private_key)
+        pool_key = (host, port, user, key.get_fingerprint().hex())
+        while True:
+            client, reused = self.acquire(pool_key, key, timeout)
+            pooled_client = PooledSshClient(client)
+            try:
+                result = function(pooled_client)
+            except (paramiko.SSHException, OSError, EOFError):
+                self.release(pool_key, client, broken=True)
+                if reused and not pooled_client.started:
+                    continue
+                raise
+            except Exception:
+                self.release(pool_key, client, broken=True)
+                raise
+            self.release(pool_key, client)
+            return result
+
+    def acquire(self, pool_key, key, timeout):
+        host_key = pool_key[:2]
+        deadline = time.monotonic() + timeout
+        with self.condition:
+            self.start_janitor()
+            while True:
+                clients = self.idle.get(pool_key)
+                while clients:
+                    client, _ = clients.pop()
+                    transport = client.get_transport()
+                    if transport is not None and transport.is_active():
+                        return client, True
+                    self.close(host_key, client)
+                if self.open_per_host.get(host_key, 0) < max(1, get_settings().ssh_pool_max_per_host):
+                    self.open_per_host[host_key] = self.open_per_host.get(host_key, 0) + 1
+                    break
+                # make room by closing an idle connection of another user of the same host
+                if self.evict_idle(lambda other_key: other_key[:2] == host_key and other_key != pool_key, limit=1):
+                    continue
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise TimeoutError(f"No free SSH connection to {host_key[0]}:{host_key[1]} after {timeout} seconds.")
+                self.condition.wait(remaining)
+
+        try:
+            client = paramiko.SSHClient()
+            client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+            client.connect(hostname=pool_key[0], port=pool_key[1], username=pool_key[2], pkey=key, timeout=timeout, allow_agent=False, look_for_keys=False)
+            client.get_transport().set_keepalive(get_settings().ssh_keepalive_interval)
+        except Exception:
+            with self.condition:
+                self.open_per_host[host_key] -= 1
+                self.condition.notify_all()
+            raise
+        return client, False
+
+    def release(self, pool_key, client, broken=False):
+        with self.condition:
+            transport = client.get_transport()
+            if broken or transport is None or not transport.is_active():
+                self.close(pool_key[:2], client)
+            else:
+                self.idle.setdefault(pool_key, []).append((client, time.monotonic()))
+            self.condition.notify_all()
+
+    def close(self, host_key, client):
+        # called with the condition held
+        try:
+            client.close()
+        except Exception:
+            pass
+        self.open_per_host[host_key] -= 1
+        if self.open_per_host[host_key] <= 0:
+            del self.open_per_host[host_key]
+
+    def evict_idle(self, match, limit=None, idle_for=0):
+        # called with the condition held
+        evicted = 0
+        now = time.monotonic()
+        for pool_key in list(self.idle):
+            if not match(pool_key):
+                continue
+            clients = self.idle[pool_key]
+            for entry in list(clients):
+                if limit is not None and evicted >= limit:
+                    break
+                if now - entry[1] >= idle_for:
+                    clients.remove(entry)
+                    self.close(pool_key[:2], entry[0])
+                    evicted += 1
+            if not clients:
+                del self.idle[pool_key]
+        if evicted:
+            self.condition.notify_all()
+        return evicted
+
+    def start_janitor(self):
+        if self.janitor is None:
+            self.janitor = threading.Thread(target=self.evict_loop, name="ssh-pool-janitor", daemon=True)
+            self.janitor.start()
+
+    def evict_loop(self):
+        while True:
+            time.sleep(30)
+            with self.condition:
+                self.evict_idle(lambda pool_key: True, idle_for=get_settings().ssh_pool_idle_timeout)
+
+ssh_pool = SshConnectionPool()
+
+def parse_token_request(data):
+    """Validate a token request. Returns (host, port, user, private_key, time_token_expire)."""
     user = data.get('user')
     host = data.get('host')
-    port = data.get('port')
+    port = int(data.get('port') or 22)
     time_token_expire = data.get('time_token_expire')
     private_key = data.get('private_key')
 
     if time_token_expire == None:
         time_token_expire = 3600
+    if not is_positive_integer(time_token_expire):
+        raise ValueError("time_token_expire must be an integer greater than 0, in seconds.")
+    if not user or not host or not private_key:
+        raise ValueError("Missing one or more parameters: 'user', 'host', 'private_key'.")
+    return host, port, user, private_key, int(time_token_expire)
 
-    command = '/usr/bin/dcv_get_token ' + time_token_expire
+def run_dcv_get_token(ssh, time_token_expire):
+    command = '/usr/bin/dcv_get_token ' + str(time_token_expire)
+    stdin, stdout, stderr = ssh.exec_command(command)
+    output = stdout.read().decode()
+    error = stderr.read().decode()
+    return output, error
 
-    try:
-        key = paramiko.RSAKey.from_private_key(StringIO(private_key))
-        ssh = paramiko.SSHClient()
-        ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-        ssh.connect(hostname=host, username=user, port=port, pkey=key)
+def request_token_over_ssh(data):
+    """Run dcv_get_token over a pooled SSH connection. Returns (output, error)."""
+    host, port, user, private_key, time_token_expire = parse_token_request(data)
+    return ssh_pool.run(host, port, user, private_key, lambda ssh: run_dcv_get_token(ssh, time_token_expire))
 
-        stdin, stdout, stderr = ssh.exec_command(command)
-        output = stdout.read().decode()
-        error = stderr.read().decode()
+@app.route('/request_token', methods=['POST'])
+def execute_ssh_command():
+    data = request.get_json()
 
-        ssh.close()
+    try:
+        output, error = request_token_over_ssh(data)
 
         return create_response(
             message=output,
@@ -707,6 +2466,270 @@ def execute_ssh_command():
             return_code=500
         )
 
+@app.route('/request_tokens', methods=['POST'])
+def execute_ssh_command_batch():
+    data = request.get_json() or {}
+    requests = data.get('requests')
+    if not isinstance(requests, list) or not requests:
+        return create_response("Missing 'requests' list.", return_code=400)
+
+    results = [None] * len(requests)
+    groups = {}
+    for position, entry in enumerate(requests):
+        try:
+            host, port, user, private_key, time_token_expire = parse_token_request(entry or {})
+        except Exception as e:
+            results[position] = {"user": (entry or {}).get('user'), "host": (entry or {}).get('host'), "message": "SSH failed.", "stdout": None, "stderr": str(e), "return_code": 400}
+            continue
+        groups.setdefault((host, port, user, private_key), []).append((position, time_token_expire))
+
+    def issue(group_key, entries):
+        # all the tokens of the same user and host are issued over one connection
+        host, port, user, private_key = group_key
+
+        def issue_all(ssh):
+            for position, time_token_expire in entries:
+                if results[position] is None:
+                    output, error = run_dcv_get_token(ssh, time_token_expire)
+                    results[position] = {"user": user, "host": host, "message": output, "stdout": output, "stderr": error, "return_code": 200}
+
+        try:
+            ssh_pool.run(host, port, user, private_key, issue_all)
+        except Exception as e:
+            for position, _ in entries:
+                if results[position] is None:
+                    results[position] = {"user": user, "host": host, "message": "SSH failed.", "stdout": None, "stderr": str(e), "return_code": 500}
+
+    if groups:
+        with ThreadPoolExecutor(max_workers=min(len(groups), 16)) as executor:
+            for future in [executor.submit(issue, group_key, entries) for group_key, entries in groups.items()]:
+                future.result()
+
+    return create_response(results, return_code=200)
+
+class TokenRegistry:
+    """DCV authentication tokens, stored in the shared store and revoked when they expire.
+
+    Any API worker can issue tokens. The worker running the background
+    tasks keeps the expiries in a min-heap, reloaded from the store when
+    another worker issued a token, and revokes each token within a second
+    of its expiry.
+    """
+
+    AUTH_DIR = "/var/run/dcvsimpleextauth/"
+
+    def __init__(self, store):
+        self.store = store
+        self.lock = threading.Lock()
+        self.heap = []
+        self.generation = None
+
+    def add_auth(self, user, token):
+        result = dcv_executor.run(["dcvsimpleextauth", "add-user", "--session", user, "--auth-dir", self.AUTH_DIR, "--user", user, "--append"], input=token + "\n")
+        if result.returncode != 0:
+            raise RuntimeError(f"dcvsimpleextauth add-user failed: {result.stderr.strip()}")
+
+    @contextlib.contextmanager
+    def user_lock(self, user):
+        """Serialize the changes of the tokens of user in all the API worker processes.
+
+        dcvsimpleextauth removes all the tokens of a session at once, so a
+        token added while a revocation restores the valid tokens would be
+        lost while still recorded as active.
+        """
+        lock_dir = os.path.join(get_settings().dcv_management_state_dir, "token-locks")
+        os.makedirs(lock_dir, exist_ok=True)
+        with open(os.path.join(lock_dir, f"{sanitize_filename(user)}.lock"), "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            yield
+
+    def issue(self, user, expire):
+        token = secrets.token_hex(8)
+        with self.user_lock(user):
+            issued = time.time()
+            self.add_auth(user, token)
+            self.store.connection().execute(
+                "INSERT INTO tokens (token, user, issued, expires, revoked) VALUES (?, ?, ?, ?, NULL)",
+                (token, user, issued, issued + expire)
+            )
+        self.store.increment("tokens_generation")
+        return {"token": token, "user": user, "issued": issued, "expires": issued + expire}
+
+    def owner_of(self, token):
+        row = self.store.connection().execute("SELECT user FROM tokens WHERE token = ?", (token,)).fetchone()
+        return row[0] if row is not None else None
+
+    def active(self, user=None):
+        query = "SELECT token, user, issued, expires FROM tokens WHERE revoked IS NULL AND expires > ?"
+        parameters = [time.time()]
+        if user:
+            query += " AND user = ?"
+            parameters.append(user)
+        return [{"token": token, "user": user, "issued": issued, "expires": expires} for token, user, issued, expires in self.store.connection().execute(query, parameters)]
+
+    def revoke(self, tokens):
+        """Revoke the given tokens, keeping the other valid tokens of the same users."""
+        connection = self.store.connection()
+        now = time.time()
+        users = set()
+        for token in tokens:
+            row = connection.execute("SELECT user FROM tokens WHERE token = ? AND revoked IS NULL", (token,)).fetchone()
+            if row is not None:
+                connection.execute("UPDATE tokens SET revoked = ? WHERE token = ?", (now, token))
+                users.add(row[0])
+        for user in users:
+            # dcvsimpleextauth removes all the tokens of a session, so add back the ones still valid
+            with self.user_lock(user):
+                result = dcv_executor.run(["dcvsimpleextauth", "remove-auth", "--session", user, "--auth-dir", self.AUTH_DIR])
+                if result.returncode != 0:
+                    logging.error(f"[DCV Management Token] dcvsimpleextauth remove-auth failed for user '{user}': {result.stderr.strip()}")
+                for entry in self.active(user):
+                    try:
+                        self.add_auth(user, entry["token"])
+                    except Exception as e:
+                        logging.error(f"[DCV Management Token] Failed to restore a valid token of user '{user}': {e}")
+            logging.info(f"[DCV Management Token] Expired or revoked tokens of user '{user}' were removed.")
+        return users
+
+    def import_token_files(self, tokens_path):
+        """Move the tokens created by the old dcv_get_token script (one file per token) into the store."""
+        for token_file in glob.glob(os.path.join(tokens_path, "*")):
+            try:
+                with open(token_file) as file:
+                    user, token, timestamp, expire = file.read().strip().split(";")
+                self.store.connection().execute(
+                    "INSERT OR IGNORE INTO tokens (token, user, issued, expires, revoked) VALUES (?, ?, ?, ?, NULL)",
+                    (token, user, float(timestamp), float(timestamp) + float(expire))
+                )
+                os.remove(token_file)
+            except Exception as e:
+                logging.error(f"[DCV Management Token] Failed to import the token file '{token_file}': {e}")
+        self.store.increment("tokens_generation")
+
+    def reload(self):
+        generation = self.store.get("tokens_generation")
+        if generation == self.generation:
+            return
+        rows = self.store.connection().execute("SELECT expires, token FROM tokens WHERE revoked IS NULL").fetchall()
+        with self.lock:
+            self.heap = [(expires, token) for expires, token in rows]
+            heapq.heapify(self.heap)
+            self.generation = generation
+
+    def revoke_expired(self):
+        """Revoke the expired tokens. Returns the seconds until the next expiry."""
+        self.reload()
+        now = time.time()
+        expired = []
+        with self.lock:
+            while self.heap and self.heap[0][0] <= now:
+                expired.append(heapq.heappop(self.heap)[1])
+            next_expiry = self.heap[0][0] - now if self.heap else None
+        if expired:
+            self.revoke(expired)
+        return next_expiry
+
+token_registry = TokenRegistry(shared_store)
+
+def token_revocation_loop():
+    try:
+        token_registry.import_token_files(get_settings().dcv_tokens_path)
+    except Exception as e:
+        logging.error(f"[DCV Management Token] Failed to import the token files: {e}")
+    while True:
+        try:
+            next_expiry = token_registry.revoke_expired()
+        except Exception as e:
+            logging.error(f"[DCV Management Token] Token revocation failed: {e}")
+            next_expiry = None
+        # wake up at least every second to see the tokens issued by the other workers
+        time.sleep(1 if next_expiry is None else max(0.05, min(next_expiry, 1)))
+
+def local_peer_uid(environ):
+    """uid of the local process that opened the TCP connection of the request, or None.
+
+    Only connections from the loopback interface are identified: the client
+    socket is looked up by its ports in /proc/net/tcp and /proc/net/tcp6,
+    which also list the uid owning each socket.
+    """
+    try:
+        address = ipaddress.ip_address(environ.get("REMOTE_ADDR", ""))
+        client_port = int(environ["REMOTE_PORT"])
+        server_port = int(environ["SERVER_PORT"])
+    except (KeyError, ValueError):
+        return None
+    if getattr(address, "ipv4_mapped", None) is not None:
+        address = address.ipv4_mapped
+    if not address.is_loopback:
+        return None
+    for table in ("/proc/net/tcp", "/proc/net/tcp6"):
+        try:
+            with open(table) as f:
+                next(f)
+                for line in f:
+                    fields = line.split()
+                    # local and remote addresses are "hex address:hex port"; state 01 is ESTABLISHED
+                    if fields[3] == "01" and int(fields[1].rsplit(":", 1)[1], 16) == client_port and int(fields[2].rsplit(":", 1)[1], 16) == server_port:
+                        return int(fields[7])
+        except OSError:
+            continue
+    return None
+
+def authorize_token_user(user):
+    """None if the caller may manage the tokens of user (its own, or any as root), otherwise an error response."""
+    uid = local_peer_uid(request.environ)
+    if uid is None:
+        return create_response("Forbidden: tokens are only issued to local callers.", return_code=403)
+    if uid == 0:
+        return None
+    try:
+        if pwd.getpwnam(user).pw_uid == uid:
+            return None
+    except KeyError:
+        pass
+    return create_response("Forbidden: the caller can only manage its own tokens.", return_code=403)
+
+@app.route('/tokens', methods=['POST'])
+def issue_token():
+    user = request.args.get('user')
+    expire = request.args.get('time_token_expire', '3600')
+    if not user:
+        return create_response("Missing user parameter.", return_code=400)
+    if not is_positive_integer(expire):
+        return create_response("Expire time is invalid. Please insert a integer value greater than 0, in seconds.", return_code=400)
+    forbidden = authorize_token_user(user)
+    if forbidden is not None:
+        return forbidden
+    try:
+        token = token_registry.issue(user, int(expire))
+    except Exception as e:
+        return create_response("Error: Failed to issue the token.", stderr=str(e), return_code=500)
+    return create_response(token, stdout=token["token"], return_code=200)
+
+@app.route('/tokens', methods=['GET'])
+def list_tokens():
+    try:
+        tokens = token_registry.active(request.args.get('user'))
+    except Exception as e:
+        return create_response("Error: Failed to list the tokens.", stderr=str(e), return_code=500)
+    return create_response([{key: value for key, value in token.items() if key != "token"} for token in tokens], return_code=200)
+
+@app.route('/tokens/<token>', methods=['DELETE'])
+def revoke_token(token):
+    try:
+        user = token_registry.owner_of(token)
+        if user is None:
+            return create_response("Token not found.", return_code=404)
+        forbidden = authorize_token_user(user)
+        if forbidden is not None:
+            return forbidden
+        users = token_registry.revoke([token])
+    except Exception as e:
+        return create_response("Error: Failed to revoke the token.", stderr=str(e), return_code=500)
+    if not users:
+        return create_response("Token not found.", return_code=404)
+    return create_response("Token revoked.", return_code=200)
+
 @app.route('/count-sessions-by-owner', methods=['GET'])
 def count_sessions(owner=None):
     try:
@@ -720,13 +2743,11 @@ def count_sessions(owner=None):
                 return_code=400
             )
         
-        response = get_list_sessions() # tuple: json, http code
-        data = response[0] # json part
-        data_parsed = json.loads(data.get_data(as_text=True))
-        stdout = data_parsed.get("stdout", "")
-        
-        # Count occurrences of the owner in the message
-        count = stdout.count(f"Session: '{owner}'")
+        index = get_session_index()
+        if index is None:
+            raise RuntimeError("dcv list-sessions failed")
+
+        count = len(index.owned_by(owner))
 
         return create_response(
             message=str(count),
@@ -734,7 +2755,7 @@ def count_sessions(owner=None):
             stderr=None,
             return_code=200
         )
-    except:
+    except Exception as e:
         return create_response(
             message="Failed to run count-sessions.",
             stdout=None,
@@ -742,71 +2763,188 @@ def count_sessions(owner=None):
             return_code=500
         )
 
+def run_create_session(owner):
+    """Create the session of owner unless owner already has one.
+
+    Returns (status, stdout, stderr) where status is "created", "exists" or "error".
+    """
+    index = get_session_index()
+    if index is None:
+        return "error", None, "dcv list-sessions failed"
+
+    owner_count = len(index.owned_by(owner))
+    if owner_count != 0:
+        return "exists", f"Count: {owner_count}", None
+
+    session_type = get_session_type()
+    command = ["dcv", "create-session", "--owner", owner, "--name", owner, "--type", session_type, owner]
+    result = dcv_executor.run(command)
+    invalidate_session_inventory()
+
+    if result.returncode == 0:
+        return "created", result.stdout, result.stderr
+    if "already exists" in result.stderr or "already exists" in result.stdout:
+        # created outside of this service since the sessions were listed
+        return "exists", result.stdout, result.stderr
+    return "error", result.stdout, result.stderr
+
+class SessionCreator:
+    """Creates the sessions of owners, at most one creation at a time per owner.
+
+    Concurrent callers for the same owner share the creation in flight in
+    this process, and a lock file per owner serializes the creations of the
+    other API worker processes, which then find the session created. Each
+    creation is saved as a job in the shared store, so its status can be
+    queried from any worker.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.inflight = {}
+        self.events = {}
+
+    def create(self, owner, wait=True):
+        """Create the session of owner, or join the creation in flight. Returns the creation job."""
+        with self.lock:
+            job = self.inflight.get(owner)
+            leader = job is None
+            if leader:
+                job = self.inflight[owner] = {"id": uuid.uuid4().hex, "owner": owner, "status": "running", "stdout": None, "stderr": None, "created": time.time(), "updated": time.time()}
+                self.events[job["id"]] = threading.Event()
+            event = self.events[job["id"]]
+        if leader:
+            self.save(job)
+            if wait:
+                self.run(job)
+            else:
+                threading.Thread(target=self.run, args=(job,), name="session-creation", daemon=True).start()
+        elif wait:
+            event.wait()
+        return dict(job)
+
+    def run(self, job):
+        owner = job["owner"]
+        try:
+            lock_dir = os.path.join(get_settings().dcv_management_state_dir, "create-locks")
+            os.makedirs(lock_dir, exist_ok=True)
+            with open(os.path.join(lock_dir, f"{sanitize_filename(owner)}.lock"), "w") as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                # the index of the caller can predate a creation that finished since; list the sessions again
+                invalidate_session_inventory()
+                status, output, error = run_create_session(owner)
+        except Exception as e:
+            logging.error(f"[DCV Management Session] Failed to create the session of '{owner}': {e}")
+            status, output, error = "error", None, str(e)
+        job.update({"status": status, "stdout": output, "stderr": error, "updated": time.time()})
+        self.save(job)
+        with self.lock:
+            del self.inflight[owner]
+            event = self.events.pop(job["id"])
+        event.set()
+
+    def save(self, job):
+        try:
+            shared_store.set_job(job["id"], "session_creation", job)
+        except Exception as e:
+            logging.error(f"[DCV Management Session] Failed to save the creation job '{job['id']}': {e}")
+
+    def get(self, job_id, wait=0):
+        """The creation job, after waiting up to wait seconds for it to finish."""
+        deadline = time.monotonic() + wait
+        while True:
+            with self.lock:
+                event = self.events.get(job_id)
+            job = shared_store.get_job(job_id, "session_creation")
+            remaining = deadline - time.monotonic()
+            if job is None or job["status"] != "running" or remaining <= 0:
+                return job
+            # creations started by another worker process are polled
+            if event is not None:
+                event.wait(remaining)
+            else:
+                time.sleep(min(remaining, 0.25))
+
+session_creator = SessionCreator()
+
+def create_owner_session(owner):
+    """Create the session of owner unless owner already has one, sharing a creation already in flight.
+
+    Returns (status, stdout, stderr) where status is "created", "exists" or "error".
+    """
+    job = session_creator.create(owner)
+    return job["status"], job["stdout"], job["stderr"]
+
 @app.route('/create-session', methods=['GET'])
 def create_session():
     owner = request.args.get('owner')
     if not owner:
         return create_response("Missing owner parameter. Please specify owner in the query string.", return_code=400)
-    response = count_sessions(owner)
-    data = response[0]
-    data_parsed = json.loads(data.get_data(as_text=True))
-    owner_count = int(data_parsed["message"])
-    session_type = get_session_type()
-    command = " ".join(["/usr/bin/dcv", "create-session", "--owner", owner, "--name", owner, "--type", session_type, owner])
-    if owner_count == 0:
-        try:
-            process = subprocess.Popen(command, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, stdin=subprocess.PIPE)
-            output, error = process.communicate()
-            if process.returncode == 0:
-                return create_response(
-                    message="Created.",
-                    stdout=output.decode(),
-                    stderr=error.decode(),
-                    return_code=200
-                )
-            else:
-                return create_response(
-                    message="Error: Failed to run create-session.",
-                    stdout=output.decode(),
-                    stderr=error.decode(),
-                    return_code=500
-                )
-        except Exception as e:
-                return create_response(
-                    message="Error: Failed to run create-session.",
-                    stdout=None,
-                    stderr=str(e),
-                    return_code=500
-                )
-    else:
+
+    if request.args.get('async', 'false').strip().lower() == 'true':
+        job = session_creator.create(owner, wait=False)
+        return create_response(job, stdout=job["id"], return_code=202)
+
+    status, output, error = create_owner_session(owner)
+    if status == "created":
+        return create_response(
+            message="Created.",
+            stdout=output,
+            stderr=error,
+            return_code=200
+        )
+    elif status == "exists":
         return create_response(
             message="Already exist.",
-            stdout=f"Count: {owner_count}",
+            stdout=output,
             stderr=None,
             return_code=500
         )
+    else:
+        return create_response(
+            message="Error: Failed to run create-session.",
+            stdout=output,
+            stderr=error,
+            return_code=500
+        )
+
+@app.route('/session-creations/<job_id>', methods=['GET'])
+def get_session_creation(job_id):
+    try:
+        wait = min(float(request.args.get('wait', '0')), 60)
+    except ValueError:
+        return create_response("wait must be a number of seconds.", return_code=400)
+    job = session_creator.get(job_id, max(wait, 0))
+    if job is None:
+        return create_response(f"Session creation '{job_id}' not found.", return_code=404)
+    return create_response(job, return_code=200)
+
+def run_close_session(session_id):
+    result = dcv_executor.run(["dcv", "close-session", session_id])
+    invalidate_session_inventory()
+    if result.returncode == 0:
+        approval_broker.revoke(session_id)
+    return result.returncode, result.stdout, result.stderr
 
 @app.route('/close-session', methods=['GET'])
 def close_session(session_id=None):
-    session_id = request.args.get('session_id')
+    if not session_id:
+        session_id = request.args.get('session_id')
     if not session_id:
         return create_response("Missing session_id parameter. Please specify session_id in the query string.", return_code=400)
 
-    command = " ".join(["dcv", "close-session", session_id])
     try:
-        process = subprocess.Popen(command, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, stdin=subprocess.PIPE)
-        output, error = process.communicate()
-        if process.returncode == 0:
-            return create_response("closed", stdout=output.decode(), stderr=error.decode())
+        returncode, output, error = run_close_session(session_id)
+        if returncode == 0:
+            return create_response("closed", stdout=output, stderr=error)
         else:
-            return create_response("Error: Failed to run close-session", stdout=output.decode(), stderr=error.decode(), return_code=500)
+            return create_response("Error: Failed to run close-session", stdout=output, stderr=error, return_code=500)
     except Exception as e:
         return create_response("Error: Failed to run close-session", stderr=str(e), return_code=500)
 
 @app.route('/list-connections', methods=['GET'])
 def list_connections(session_id=None):
-    owner = request.args.get('session_id')
-    if not owner:
+    session_id = request.args.get('session_id')
+    if not session_id:
         return create_response(
         message="Missing owner parameter. Please specify owner in the query string.",
         stdout=None,
@@ -814,12 +2952,10 @@ def list_connections(session_id=None):
         return_code=400
     )
 
-    command = " ".join(["dcv", "list-connections", session_id])
     try:
-        process = subprocess.Popen(command, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, stdin=subprocess.PIPE)
-        output, error = process.communicate()
-        output = output.decode("utf-8")
-        error = error.decode("utf-8")
+        result = dcv_executor.run(["dcv", "list-connections", session_id])
+        output = result.stdout
+        error = result.stderr
         return create_response(
         message=output,
         stdout=output,
@@ -834,21 +2970,83 @@ def list_connections(session_id=None):
             return_code=500
         )
 
+def evaluate_session_timeout(session_id, session_timeout, close=True):
+    """Describe one session and close it if it has been idle for longer than session_timeout.
+
+    Returns a decision dict: "closed", "would-close" (close=False), "idle",
+    "active" (no connections, but the owner processes are using CPU),
+    "connected" or "error".
+    """
+    decision = {"session_id": session_id, "decision": "error", "inactive_duration": None, "num_connections": None, "stdout": "", "stderr": ""}
+    try:
+        process = dcv_executor.run(["dcv", "describe-session", session_id, "--json"])
+        output = process.stdout
+        error = process.stderr
+        decision["stdout"] = output
+        decision["stderr"] = error
+
+        if process.returncode != 0:
+            decision["message"] = "Error: Failed to describe session."
+            return decision
+
+        data = json.loads(output)
+        num_connections = data.get("num-of-connections", 0)
+        creation_time_str = data.get("creation-time")
+        disconnection_time_str = data.get("last-disconnection-time")
+        decision["num_connections"] = num_connections
+
+        # Use disconnection time if available; otherwise, use creation time as fallback.
+        last_activity_str = disconnection_time_str if disconnection_time_str else creation_time_str
+
+        # define the time format string
+        format_string = "%Y-%m-%dT%H:%M:%S.%fZ"
+        last_activity = datetime.strptime(last_activity_str, format_string)
+
+        # Calculate inactivity using the current time
+        current_time = datetime.utcnow()
+        inactive_duration = (current_time - last_activity).total_seconds()
+        decision["inactive_duration"] = inactive_duration
+
+        activity = None
+        if num_connections == 0 and inactive_duration > session_timeout:
+            activity = session_activity_reason(data.get("owner"))
+
+        if num_connections != 0:
+            decision["decision"] = "connected"
+            decision["message"] = "There are users still connected under DCV session."
+        elif inactive_duration <= session_timeout:
+            decision["decision"] = "idle"
+            decision["message"] = "There are no users connected, but the session has not been inactive long enough."
+        elif activity is not None:
+            decision["decision"] = "active"
+            decision["message"] = f"There are no users connected, but the session is still working: {activity}"
+        elif not close:
+            decision["decision"] = "would-close"
+            decision["message"] = "The session is inactive for too long and would be closed."
+        else:
+            returncode, close_output, close_error = run_close_session(session_id)
+            decision["stdout"] = close_output
+            decision["stderr"] = close_error
+            if returncode == 0:
+                decision["decision"] = "closed"
+                decision["message"] = "closed"
+            else:
+                decision["message"] = "Error: Failed to run close-session"
+    except Exception as e:
+        decision["message"] = "Error: Failed to check session timeout."
+        decision["stderr"] = str(e)
+    return decision
+
 @app.route('/check-session-timedout', methods=['GET'])
 def check_session_timedout(session_id=None):
     session_id = request.args.get('session_id')
 
-    settings = read_settings_conf()
-    session_timeout = int(settings.get('session_timeout', ''))
-
-    # fallback value, disabling the timedout check
-    if not session_timeout:
-        session_timeout = 0
+    session_timeout = get_settings().session_timeout
 
     if session_timeout == 0:
         return create_response(
             message="Session timedout check is disabled because session_timeout is equal zero.",
-            stdout=f"Inactive duration: {inactive_duration} seconds",
+            stdout=None,
             stderr=None,
             return_code=200
         )
@@ -860,83 +3058,863 @@ def check_session_timedout(session_id=None):
             stderr=None,
             return_code=400
         )
-    
-    command= " ".join(["dcv", "describe-session", session_id, "--json"])
 
-    try:
-        process = subprocess.Popen(command, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, stdin=subprocess.PIPE)
-        output, error = process.communicate()
-        output = output.decode("utf-8")
-        error = error.decode("utf-8")
+    decision = evaluate_session_timeout(session_id, session_timeout)
+    if decision["decision"] == "error":
+        return create_response(
+            message=decision["message"],
+            stdout=decision["stdout"],
+            stderr=decision["stderr"],
+            return_code=500
+        )
+    if decision["decision"] == "idle":
+        return create_response(
+            message=decision["message"],
+            stdout=f"Inactive duration: {decision['inactive_duration']} seconds",
+            stderr=decision["stderr"],
+            return_code=200
+        )
+    return create_response(
+        message=decision["message"],
+        stdout=decision["stdout"],
+        stderr=decision["stderr"],
+        return_code=200
+    )
 
-        if process.returncode != 0:
-            return create_response(
-                message="Error: Failed to describe session.",
-                stdout=output,
-                stderr=error,
-                return_code=500
-            )
+session_timeout_sweep_lock = threading.Lock()
 
-        data = json.loads(output)
-        num_connections = data.get("num-of-connections", 0)
-        creation_time_str = data.get("creation-time")
-        disconnection_time_str = data.get("last-disconnection-time")
+def sweep_session_timeouts(close=True):
+    """Evaluate every session in one pass, describing them through a bounded worker pool."""
+    settings = get_settings()
+    session_timeout = settings.session_timeout
+    if session_timeout == 0:
+        return []
 
-        # Use disconnection time if available; otherwise, use creation time as fallback.
-        last_activity_str = disconnection_time_str if disconnection_time_str else creation_time_str
-        
-        # define the time format string
-        format_string = "%Y-%m-%dT%H:%M:%S.%fZ"
-        last_activity = datetime.strptime(last_activity_str, format_string)
-        
-        # Calculate inactivity using the current time
-        current_time = datetime.utcnow()
-        inactive_duration = (current_time - last_activity).total_seconds()
+    with session_timeout_sweep_lock:
+        invalidate_session_inventory()
+        index = get_session_index()
+        if index is None:
+            raise RuntimeError("dcv list-sessions failed")
 
-        if num_connections == 0:
-            if inactive_duration > session_timeout:
-                return close_session(session_id)
-            else:
-                return create_response(
-                    message="There are no users connected, but the session has not been inactive long enough.",
-                    stdout=f"Inactive duration: {inactive_duration} seconds",
-                    stderr=error,
-                    return_code=200
-                )
-        else:
-            return create_response(
-                message="There are users still connected under DCV session.",
-                stdout=output,
-                stderr=error,
-                return_code=200
-            )
+        session_ids = [session.id for session in index.sessions]
+        if not session_ids:
+            return []
+
+        workers = max(1, min(settings.session_timeout_sweep_workers, len(session_ids)))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            decisions = list(executor.map(lambda session_id: evaluate_session_timeout(session_id, session_timeout, close), session_ids))
+
+    for decision in decisions:
+        if decision["decision"] == "closed":
+            logging.info(f"[DCV Management Timeout] Session '{decision['session_id']}' closed after {decision['inactive_duration']} seconds of inactivity.")
+        elif decision["decision"] == "error":
+            logging.warning(f"[DCV Management Timeout] Session '{decision['session_id']}': {decision['message']} {decision['stderr']}")
+    return decisions
+
+def run_periodic(setting_name, function, description, enabled=None, wait_first=False):
+    """Call function() every setting_name seconds, forever; errors are logged with description.
+
+    The interval is read again from settings.conf before each call. An
+    interval of 0, or enabled(settings) returning False, disables the task
+    until settings.conf changes, which is checked every minute. With
+    wait_first the first call happens after one interval.
+    """
+    while True:
+        settings = get_settings()
+        interval = getattr(settings, setting_name)
+        if interval == 0 or (enabled is not None and not enabled(settings)):
+            time.sleep(60)
+            continue
+        if wait_first:
+            wait_first = False
+            time.sleep(interval)
+            continue
+        try:
+            function()
+        except Exception as e:
+            logging.error(f"{description} failed: {e}")
+        time.sleep(interval)
+
+def session_timeout_sweeper_loop():
+    run_periodic("session_timeout_sweep_interval", sweep_session_timeouts, "[DCV Management Timeout] Session timeout sweep", wait_first=True)
+
+@app.route('/sweep-timeouts', methods=['GET', 'POST'])
+def sweep_timeouts():
+    dry_run = request.args.get('dry_run', 'false').strip().lower() == 'true'
+    if request.method == 'GET' and not dry_run:
+        # closing sessions needs a POST, so prefetchers and crawlers cannot trigger it
+        return create_response("Use POST to close the timed out sessions, or GET with dry_run=true.", return_code=405)
+
+    if get_settings().session_timeout == 0:
+        return create_response(
+            message="Session timedout check is disabled because session_timeout is equal zero.",
+            stdout=None,
+            stderr=None,
+            return_code=200
+        )
+
+    try:
+        decisions = sweep_session_timeouts(close=not dry_run)
     except Exception as e:
         return create_response(
-            message="Error: Failed to check session timeout.",
+            message="Error: Failed to sweep session timeouts.",
             stdout=None,
             stderr=str(e),
             return_code=500
         )
 
+    return create_response(
+        message=[{key: decision.get(key) for key in ("session_id", "decision", "inactive_duration", "num_connections", "message")} for decision in decisions],
+        stdout=None,
+        stderr=None,
+        return_code=200
+    )
+
+class ActivitySampler:
+    """CPU, memory (RSS) and I/O used by the processes of each session owner, sampled from /proc.
+
+    The processes are attributed to the owner by their uid, as the
+    processes of a virtual session run as its owner. Each sample stores,
+    per owner, the CPU used since the previous sample (in percent of one
+    CPU), the RSS and the I/O rate, so any API worker can read the window
+    of the last minutes.
+    """
+
+    CLOCK_TICKS = os.sysconf("SC_CLK_TCK")
+    PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+
+    def __init__(self, store):
+        self.store = store
+        self.previous = {}  # pid -> (start time, cpu ticks, io bytes)
+        self.sampled = None
+        self.uptime = None
+        self.user_names = {}
+
+    def user_name(self, uid):
+        name = self.user_names.get(uid)
+        if name is None:
+            try:
+                name = pwd.getpwuid(uid).pw_name
+            except KeyError:
+                name = str(uid)
+            self.user_names[uid] = name
+        return name
+
+    def read_process(self, pid):
+        """Returns (uid, start time in ticks since boot, cpu ticks, rss bytes, io bytes), or None if the process exited."""
+        try:
+            uid = os.stat(f"/proc/{pid}").st_uid
+            with open(f"/proc/{pid}/stat") as f:
+                stat = f.read()
+        except OSError:
+            return None
+        # the fields after the command name, which can contain spaces; the first one is the state (field 3)
+        fields = stat[stat.rindex(")") + 2:].split()
+        io = 0
+        try:
+            with open(f"/proc/{pid}/io") as f:
+                for line in f:
+                    name, _, value = line.partition(":")
+                    if name in ("read_bytes", "write_bytes"):
+                        io += int(value)
+        except OSError:
+            pass
+        return uid, int(fields[19]), int(fields[11]) + int(fields[12]), int(fields[21]) * self.PAGE_SIZE, io
+
+    def sample(self, owners):
+        """Sample the processes of owners. Returns {owner: {"cpu", "rss", "io"}}; empty for the first sample."""
+        now = time.monotonic()
+        with open("/proc/uptime") as f:
+            uptime_ticks = float(f.read().split()[0]) * self.CLOCK_TICKS
+        totals = {owner: {"cpu": 0, "rss": 0, "io": 0} for owner in owners}
+        current = {}
+        for name in os.listdir("/proc"):
+            if not name.isdigit():
+                continue
+            process = self.read_process(int(name))
+            if process is None:
+                continue
+            uid, start_time, cpu, rss, io = process
+            current[int(name)] = (start_time, cpu, io)
+            total = totals.get(self.user_name(uid))
+            if total is None or self.sampled is None:
+                continue
+            previous = self.previous.get(int(name))
+            if previous is not None and previous[0] == start_time:
+                total["cpu"] += cpu - previous[1]
+                total["io"] += io - previous[2]
+            elif start_time >= self.uptime:
+                # started since the previous sample
+                total["cpu"] += cpu
+                total["io"] += io
+            total["rss"] += rss
+
+        elapsed = now - self.sampled if self.sampled is not None else None
+        self.previous = current
+        self.sampled = now
+        self.uptime = uptime_ticks
+        if not elapsed:
+            return {}
+        return {
+            owner: {"cpu": total["cpu"] / self.CLOCK_TICKS / elapsed * 100, "rss": total["rss"], "io": total["io"] / elapsed}
+            for owner, total in totals.items()
+        }
+
+    def record(self, samples):
+        sampled = time.time()
+        with self.store.transaction() as connection:
+            connection.executemany(
+                "INSERT INTO activity_samples (owner, sampled, cpu, rss, io) VALUES (?, ?, ?, ?, ?)",
+                [(owner, sampled, sample["cpu"], sample["rss"], sample["io"]) for owner, sample in samples.items()]
+            )
+
+    def prune(self, max_age):
+        self.store.connection().execute("DELETE FROM activity_samples WHERE sampled < ?", (time.time() - max_age,))
+
+    def window(self, owner, minutes):
+        """Summary of the samples of owner in the last minutes; "covered" is False while there are no samples for the whole window."""
+        now = time.time()
+        connection = self.store.connection()
+        oldest = connection.execute("SELECT MIN(sampled) FROM activity_samples WHERE owner = ?", (owner,)).fetchone()[0]
+        row = connection.execute(
+            "SELECT COUNT(*), MAX(cpu), AVG(cpu), AVG(io), MAX(sampled) FROM activity_samples WHERE owner = ? AND sampled >= ?",
+            (owner, now - minutes * 60)
+        ).fetchone()
+        last = connection.execute("SELECT rss FROM activity_samples WHERE owner = ? ORDER BY sampled DESC LIMIT 1", (owner,)).fetchone()
+        interval = get_settings().activity_sample_interval
+        return {
+            "owner": owner,
+            "minutes": minutes,
+            "samples": row[0],
+            "covered": oldest is not None and oldest <= now - minutes * 60 + 2 * interval and row[4] is not None and row[4] >= now - 2 * interval,
+            "max_cpu": row[1],
+            "avg_cpu": row[2],
+            "avg_io": row[3],
+            "rss": last[0] if last is not None else None
+        }
+
+activity_sampler = ActivitySampler(shared_store)
+
+def activity_sampler_loop():
+    last_prune = 0.0
+
+    def sample():
+        nonlocal last_prune
+        index = get_session_index()
+        if index is not None:
+            samples = activity_sampler.sample(set(index.owners()))
+            if samples:
+                activity_sampler.record(samples)
+        if time.monotonic() - last_prune > 300:
+            activity_sampler.prune(get_settings().session_timeout_cpu_minutes * 60 + 600)
+            last_prune = time.monotonic()
+
+    run_periodic("activity_sample_interval", sample, "[DCV Management Activity] Activity sampling")
+
+def session_activity_reason(owner):
+    """Why the idle session of owner must not be closed yet, or None if its processes are not working."""
+    settings = get_settings()
+    threshold = settings.session_timeout_cpu_threshold
+    if not threshold or not owner:
+        return None
+    minutes = settings.session_timeout_cpu_minutes
+    try:
+        summary = activity_sampler.window(owner, minutes)
+    except Exception as e:
+        return f"failed to read the CPU usage ({e})."
+    if settings.activity_sample_interval == 0 or not summary["covered"]:
+        return f"the CPU usage of the last {minutes} minutes is not known yet."
+    if summary["max_cpu"] >= threshold:
+        return f"the processes of '{owner}' used {summary['max_cpu']:.1f}% CPU in the last {minutes} minutes (threshold {threshold}%)."
+    return None
+
+@app.route('/session-activity', methods=['GET'])
+def session_activity():
+    owner = request.args.get('owner')
+    minutes = get_settings().session_timeout_cpu_minutes
+    try:
+        if owner:
+            owners = [owner]
+        else:
+            index = get_session_index()
+            owners = sorted(set(index.owners())) if index is not None else []
+        return create_response([activity_sampler.window(name, minutes) for name in owners], return_code=200)
+    except Exception as e:
+        return create_response("Error: Failed to read the session activity.", stderr=str(e), return_code=500)
+
+class MemoryPressureMonitor:
+    """Closes disconnected sessions, least recently disconnected first, while the host is short of memory.
+
+    The host is under pressure when MemAvailable is below
+    memory_pressure_min_available_percent of MemTotal, or when the tasks
+    were stalled waiting for memory (PSI "some", /proc/pressure/memory) more
+    than memory_pressure_max_psi_some percent of the time since the previous
+    check. After each close the monitor waits memory_pressure_settle_seconds
+    and checks again, so it stops as soon as the pressure drops.
+    """
+
+    PSI_PATH = "/proc/pressure/memory"
+
+    def __init__(self, store):
+        self.store = store
+        self.lock = threading.Lock()
+        self.psi_lock = threading.Lock()
+        self.psi_total = None  # (monotonic time, stalled microseconds)
+
+    def read_psi(self):
+        """Percent of the time some task was stalled on memory since the previous call, or avg10 on the first call. None without PSI."""
+        with self.psi_lock:
+            try:
+                with open(self.PSI_PATH) as f:
+                    line = f.readline()
+            except OSError:
+                return None
+            fields = dict(field.split("=") for field in line.split()[1:])
+            now = time.monotonic()
+            total = int(fields["total"])
+            previous = self.psi_total
+            self.psi_total = (now, total)
+            if previous is None or now - previous[0] < 1:
+                return float(fields["avg10"])
+            return (total - previous[1]) / ((now - previous[0]) * 1e6) * 100
+
+    def measure(self):
+        meminfo = read_meminfo()
+        return {
+            "sampled": time.time(),
+            "mem_total": meminfo["MemTotal"],
+            "mem_available": meminfo["MemAvailable"],
+            "available_percent": meminfo["MemAvailable"] / meminfo["MemTotal"] * 100,
+            "psi_some": self.read_psi()
+        }
+
+    def pressure_reason(self, measure, settings):
+        """Why the host is under memory pressure, or None."""
+        min_available = settings.memory_pressure_min_available_percent
+        if min_available and measure["available_percent"] < min_available:
+            return f"{measure['available_percent']:.1f}% of the memory is available (watermark {min_available}%)."
+        max_psi = settings.memory_pressure_max_psi_some
+        if max_psi and measure["psi_some"] is not None and measure["psi_some"] >= max_psi:
+            return f"tasks were stalled on memory {measure['psi_some']:.1f}% of the time (watermark {max_psi}%)."
+        return None
+
+    def candidates(self, settings, refresh=True):
+        """Disconnected virtual sessions that are not protected, least recently disconnected first.
+
+        With refresh=False the cached session inventory is used.
+        """
+        if refresh:
+            invalidate_session_inventory()
+        index = get_session_index()
+        if index is None:
+            raise RuntimeError("dcv list-sessions failed")
+        protect = set(settings.memory_pressure_protect)
+        sessions = [
+            session for session in index.of_type("virtual")
+            if session.num_connections == 0 and not protect.intersection((session.id, session.name, session.owner))
+        ]
+        # the timestamps share one ISO format, so they sort as strings; never connected sessions use the creation time
+        sessions.sort(key=lambda session: session.last_disconnection_time or session.creation_time or "")
+        return sessions
+
+    def run(self, dry_run=False):
+        """Check the pressure and evict sessions while it lasts. With dry_run, list the sessions that would be closed."""
+        settings = get_settings()
+        with self.lock:
+            measure = self.measure()
+            reason = self.pressure_reason(measure, settings)
+            result = {"started": measure["sampled"], "dry_run": dry_run, "pressure": reason, "measure": measure, "sessions": []}
+            if reason is None:
+                self.store.set("memory_pressure:last", json.dumps(result))
+                return result
+
+            logging.warning(f"[DCV Management Memory] Memory pressure: {reason}")
+            for session in self.candidates(settings):
+                entry = {"session_id": session.id, "owner": session.owner, "last_disconnection_time": session.last_disconnection_time}
+                result["sessions"].append(entry)
+                if dry_run:
+                    # the memory freed by a close is not known in advance: list every candidate in eviction order
+                    entry["decision"] = "would-close"
+                    continue
+                returncode, output, error = run_close_session(session.id)
+                if returncode != 0:
+                    entry["decision"] = "error"
+                    entry["stderr"] = error
+                    logging.warning(f"[DCV Management Memory] Failed to close session '{session.id}': {error}")
+                    continue
+                entry["decision"] = "closed"
+                logging.warning(f"[DCV Management Memory] Session '{session.id}' of '{session.owner}' closed to release memory.")
+                time.sleep(settings.memory_pressure_settle_seconds)
+                measure = self.measure()
+                result["measure"] = measure
+                if self.pressure_reason(measure, settings) is None:
+                    break
+            result["pressure_after"] = None if dry_run else self.pressure_reason(result["measure"], settings)
+            if result["pressure_after"] is not None:
+                logging.warning(f"[DCV Management Memory] Memory pressure remains after closing every candidate session: {result['pressure_after']}")
+            self.store.set("memory_pressure:last", json.dumps(result))
+            return result
+
+    def last(self):
+        value = self.store.get("memory_pressure:last")
+        return json.loads(value) if value is not None else None
+
+memory_pressure_monitor = MemoryPressureMonitor(shared_store)
+
+def memory_pressure_loop():
+    run_periodic(
+        "memory_pressure_interval",
+        lambda: memory_pressure_monitor.run(dry_run=get_settings().memory_pressure_dry_run),
+        "[DCV Management Memory] Memory pressure check",
+        enabled=lambda settings: settings.memory_pressure_min_available_percent or settings.memory_pressure_max_psi_some
+    )
+
+@app.route('/memory-pressure', methods=['GET'])
+def memory_pressure():
+    # read only: the last check of the monitor, the measures are only taken by the checks
+    try:
+        return create_response({
+            "last": memory_pressure_monitor.last(),
+            "candidates": [session.id for session in memory_pressure_monitor.candidates(get_settings(), refresh=False)]
+        }, return_code=200)
+    except Exception as e:
+        return create_response("Error: Failed to read the memory pressure.", stderr=str(e), return_code=500)
+
+@app.route('/memory-pressure/evict', methods=['POST'])
+def memory_pressure_evict():
+    settings = get_settings()
+    dry_run = request.args.get('dry_run', str(settings.memory_pressure_dry_run)).strip().lower() == 'true'
+    if not (settings.memory_pressure_min_available_percent or settings.memory_pressure_max_psi_some):
+        return create_response(
+            "Memory pressure eviction is disabled because memory_pressure_min_available_percent and memory_pressure_max_psi_some are equal zero.",
+            return_code=200
+        )
+    try:
+        return create_response(memory_pressure_monitor.run(dry_run=dry_run), return_code=200)
+    except Exception as e:
+        return create_response("Error: Failed to evict sessions under memory pressure.", stderr=str(e), return_code=500)
+
+def diff_sessions(previous, current):
+    """Events turning the previous "dcv list-sessions --json" entries into the current ones, both by session id."""
+    events = []
+    for session_id, entry in current.items():
+        old = previous.get(session_id)
+        if old is None:
+            events.append(("session_created", session_id, entry))
+            continue
+        if old.get("owner") != entry.get("owner"):
+            events.append(("owner_changed", session_id, {"old": old.get("owner"), "new": entry.get("owner")}))
+        if old.get("num-of-connections") != entry.get("num-of-connections"):
+            events.append(("connections_changed", session_id, {"old": old.get("num-of-connections"), "new": entry.get("num-of-connections")}))
+    for session_id, entry in previous.items():
+        if session_id not in current:
+            events.append(("session_closed", session_id, entry))
+    return events
+
+class SessionWatcher:
+    """Session changes, found by diffing "dcv list-sessions --json" snapshots taken in the background.
+
+    The events are stored in the shared store with an increasing version,
+    so watchers connected to any API worker can resume after the last
+    version they received.
+    """
+
+    SNAPSHOT_KEY = "session_watch_snapshot"
+    PRUNED_KEY = "session_events_pruned_version"
+
+    def __init__(self, store):
+        self.store = store
+
+    def snapshot(self):
+        value = self.store.get(self.SNAPSHOT_KEY)
+        return json.loads(value) if value else {"version": 0, "sessions": []}
+
+    def poll(self):
+        """Take a snapshot and store the events found since the previous one. Returns the events."""
+        result = session_inventory.get(ttl=0)
+        if result["returncode"] != 0 or result["parse_error"]:
+            raise RuntimeError(result["parse_error"] or result["stderr"].strip() or "dcv list-sessions failed")
+        index = result["data"]
+        current = {entry.get("id"): entry for entry in index.raw}
+        events = []
+        with self.store.transaction() as connection:
+            row = connection.execute("SELECT value FROM state WHERE key = ?", (self.SNAPSHOT_KEY,)).fetchone()
+            snapshot = json.loads(row[0]) if row is not None else None
+            if snapshot is not None:
+                previous = {entry.get("id"): entry for entry in snapshot["sessions"]}
+                if previous == current:
+                    return []
+                now = time.time()
+                for event_type, session_id, data in diff_sessions(previous, current):
+                    cursor = connection.execute("INSERT INTO session_events (type, session, data, created) VALUES (?, ?, ?, ?)", (event_type, session_id, json.dumps(data), now))
+                    events.append({"version": cursor.lastrowid, "type": event_type, "session": session_id, "data": data, "time": now})
+            version = events[-1]["version"] if events else (snapshot["version"] if snapshot else 0)
+            connection.execute("INSERT OR REPLACE INTO state (key, value) VALUES (?, ?)", (self.SNAPSHOT_KEY, json.dumps({"version": version, "sessions": index.raw})))
+        # also closed or taken over outside of the API service
+        for session_id in {event["session"] for event in events if event["type"] in ("session_closed", "owner_changed")}:
+            approval_broker.revoke(session_id)
+        return events
+
+    def prune(self, max_age):
+        with self.store.transaction() as connection:
+            row = connection.execute("SELECT MAX(version) FROM session_events WHERE created < ?", (time.time() - max_age,)).fetchone()
+            if row[0] is None:
+                return
+            connection.execute("DELETE FROM session_events WHERE version <= ?", (row[0],))
+            connection.execute("INSERT OR REPLACE INTO state (key, value) VALUES (?, ?)", (self.PRUNED_KEY, str(row[0])))
+
+    def events_since(self, version):
+        """Events after version, or None if some of them were pruned and the watcher must start from a snapshot."""
+        if version < int(self.store.get(self.PRUNED_KEY, 0)) or version > self.snapshot()["version"]:
+            return None
+        rows = self.store.connection().execute("SELECT version, type, session, data, created FROM session_events WHERE version > ? ORDER BY version", (version,))
+        return [{"version": row[0], "type": row[1], "session": row[2], "data": json.loads(row[3]), "time": row[4]} for row in rows]
+
+session_watcher = SessionWatcher(shared_store)
+
+def session_watcher_loop():
+    last_prune = 0.0
+
+    def watch():
+        nonlocal last_prune
+        events = session_watcher.poll()
+        if events:
+            logging.debug(f"[DCV Management Sessions] {len(events)} session events up to version {events[-1]['version']}.")
+        if time.monotonic() - last_prune > 60:
+            session_watcher.prune(get_settings().session_events_retention)
+            last_prune = time.monotonic()
+
+    run_periodic("session_watch_interval", watch, "[DCV Management Sessions] Session watch")
+
+def parse_since(value):
+    if value is None or value == "":
+        return None
+    if not value.isdigit():
+        raise ValueError("since must be a version number.")
+    return int(value)
+
+def wait_session_events(since, timeout):
+    """Wait up to timeout seconds for events after since. Returns (version, events, snapshot); snapshot is set when resuming is not possible."""
+    deadline = time.monotonic() + timeout
+    while True:
+        if since is None:
+            snapshot = session_watcher.snapshot()
+            return snapshot["version"], [], snapshot
+        events = session_watcher.events_since(since)
+        if events is None:
+            snapshot = session_watcher.snapshot()
+            return snapshot["version"], [], snapshot
+        if events or time.monotonic() >= deadline:
+            return (events[-1]["version"] if events else since), events, None
+        # the events are written by the background worker, which may be another process
+        time.sleep(0.5)
+
+class WatchSlots:
+    """Number of request threads of this process waiting for session events.
+
+    The watchers share the worker threads with /pam/authorize, so at most
+    session_watch_max_streams of them block a thread at a time; the others
+    get an immediate answer.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.active = 0
+
+    def try_acquire(self):
+        with self.lock:
+            if self.active >= get_settings().session_watch_max_streams:
+                return False
+            self.active += 1
+            return True
+
+    def release(self):
+        with self.lock:
+            self.active -= 1
+
+watch_slots = WatchSlots()
+
+@app.route('/sessions/events', methods=['GET'])
+def session_events():
+    if get_settings().session_watch_interval == 0:
+        return create_response("The session watcher is disabled (session_watch_interval=0).", return_code=503)
+    try:
+        since = parse_since(request.args.get('since'))
+        timeout = min(float(request.args.get('timeout', '25')), 60)
+    except ValueError as e:
+        return create_response(str(e), return_code=400)
+
+    if timeout > 0 and watch_slots.try_acquire():
+        try:
+            version, events, snapshot = wait_session_events(since, timeout)
+        finally:
+            watch_slots.release()
+    else:
+        # no thread to spare for waiting: answer with the events already there, the client polls again
+        version, events, snapshot = wait_session_events(since, 0)
+    return create_response({"version": version, "events": events, "snapshot": snapshot}, return_code=200)
+
+def format_sse(event_type, version, data):
+    return f"id: {version}\nevent: {event_type}\ndata: {json.dumps(data)}\n\n"
+
+def client_disconnected(client):
+    """True if the client closed the connection of a streamed response (the socket reads end of file)."""
+    if client is None:
+        return False
+    try:
+        readable, _, _ = select.select([client], [], [], 0)
+        return bool(readable) and client.recv(1, socket.MSG_PEEK | socket.MSG_DONTWAIT) == b""
+    except (OSError, ValueError):
+        return True
+
+@app.route('/sessions/watch', methods=['GET'])
+def watch_sessions():
+    settings = get_settings()
+    if settings.session_watch_interval == 0:
+        return create_response("The session watcher is disabled (session_watch_interval=0).", return_code=503)
+    try:
+        # EventSource clients send the last id received when they reconnect
+        since = parse_since(request.headers.get('Last-Event-ID') or request.args.get('since'))
+    except ValueError as e:
+        return create_response(str(e), return_code=400)
+    stream_timeout = settings.session_watch_stream_timeout
+    if not watch_slots.try_acquire():
+        body, status = create_response("Too many session watchers, retry later or use /sessions/events.", return_code=503)
+        return body, status, {"Retry-After": "10"}
+
+    client = request.environ.get("gunicorn.socket") or request.environ.get("werkzeug.socket")
+
+    def stream():
+        version = since
+        # the stream ends after stream_timeout seconds to free the worker thread, clients reconnect with Last-Event-ID
+        deadline = time.monotonic() + stream_timeout if stream_timeout else None
+        keepalive = time.monotonic() + 15
+        while deadline is None or time.monotonic() < deadline:
+            version, events, snapshot = wait_session_events(version, 1)
+            if snapshot is not None:
+                yield format_sse("snapshot", version, snapshot)
+            for event in events:
+                yield format_sse(event["type"], event["version"], event)
+            if snapshot is not None or events:
+                keepalive = time.monotonic() + 15
+            elif time.monotonic() >= keepalive:
+                yield ": keepalive\n\n"
+                keepalive = time.monotonic() + 15
+            elif client_disconnected(client):
+                # a write would only fail after the next keepalive; give the thread back now
+                return
+
+    response = Response(stream_with_context(stream()), mimetype="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+    # called by the WSGI server when the stream ends or the client goes away
+    response.call_on_close(watch_slots.release)
+    return response
+
+class RequestMetrics:
+    """Request count and latency of each Flask route, by method and status."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.routes = {}
+        self.published = 0.0
+
+    def publish_due(self, interval, force=False):
+        """True, once per interval, when the metrics of this process must be saved in the shared store."""
+        now = time.monotonic()
+        with self.lock:
+            if not force and (not interval or now - self.published < interval):
+                return False
+            self.published = now
+            return True
+
+    def record(self, route, method, status, duration):
+        with self.lock:
+            metrics = self.routes.get((route, method))
+            if metrics is None:
+                metrics = self.routes[(route, method)] = {"statuses": {}, "histogram": Histogram()}
+            metrics["statuses"][status] = metrics["statuses"].get(status, 0) + 1
+            metrics["histogram"].observe(duration)
+
+    def snapshot(self):
+        with self.lock:
+            return [(route, method, dict(metrics["statuses"]), metrics["histogram"].snapshot()) for (route, method), metrics in self.routes.items()]
+
+request_metrics = RequestMetrics()
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.monotonic()
+
+@app.after_request
+def record_request_metrics(response):
+    started = g.pop("request_started", None)
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+        request_metrics.record(route, request.method, response.status_code, time.monotonic() - started)
+        publish_metrics()
+    return response
+
+def collect_metrics():
+    """Metrics of this process as a list of (name, type, labels, value); histogram values are snapshots."""
+    metrics = []
+    for route, method, statuses, histogram in request_metrics.snapshot():
+        labels = {"route": route, "method": method}
+        for status, count in statuses.items():
+            metrics.append(("dcv_management_http_requests_total", "counter", dict(labels, status=str(status)), count))
+        metrics.append(("dcv_management_http_request_duration_seconds", "histogram", labels, histogram))
+    for executor in (dcv_executor, prompt_executor):
+        for key, stats in executor.snapshot().items():
+            labels = {"executor": executor.name, "command": key}
+            metrics.append(("dcv_management_command_duration_seconds", "histogram", labels, stats["histogram"]))
+            metrics.append(("dcv_management_command_wait_seconds_total", "counter", labels, stats["wait_time"]))
+            metrics.append(("dcv_management_command_timeouts_total", "counter", labels, stats["timeouts"]))
+            for exit_code, count in stats["exit_codes"].items():
+                metrics.append(("dcv_management_command_exit_codes_total", "counter", dict(labels, code=str(exit_code)), count))
+        metrics.append(("dcv_management_command_slots_active", "gauge", {"executor": executor.name}, executor.global_limiter.active))
+        metrics.append(("dcv_management_command_slots_waiting", "gauge", {"executor": executor.name}, executor.global_limiter.waiting))
+    for cache in (session_inventory, session_inventory_text):
+        labels = {"cache": cache.name}
+        metrics.append(("dcv_management_cache_hits_total", "counter", labels, cache.hits))
+        metrics.append(("dcv_management_cache_shared_total", "counter", labels, cache.shared))
+        metrics.append(("dcv_management_cache_misses_total", "counter", labels, cache.misses))
+        lookups = cache.hits + cache.shared + cache.misses
+        # a caller sharing an in-flight execution did not fork either
+        metrics.append(("dcv_management_cache_hit_ratio", "gauge", labels, (cache.hits + cache.shared) / lookups if lookups else 0))
+    metrics.append(("dcv_management_notification_queue_depth", "gauge", {}, notification_dispatcher.queue_depth()))
+    ssh_stats = ssh_pool.stats()
+    metrics.append(("dcv_management_ssh_pool_connections", "gauge", {"state": "open"}, ssh_stats["open"]))
+    metrics.append(("dcv_management_ssh_pool_connections", "gauge", {"state": "idle"}, ssh_stats["idle"]))
+    return metrics
+
+def publish_metrics(force=False):
+    """Save the metrics of this worker in the shared store, so any worker can serve the metrics of all of them."""
+    if not request_metrics.publish_due(get_settings().metrics_publish_interval, force):
+        return
+    try:
+        shared_store.set(f"metrics:{os.getpid()}", json.dumps(collect_metrics()))
+    except Exception as e:
+        logging.error(f"[DCV Management Metrics] Failed to publish the metrics: {e}")
+
+def worker_metrics():
+    """Metrics of this process and the last published metrics of the other live workers, by pid."""
+    pid = os.getpid()
+    workers = {pid: collect_metrics()}
+    if not get_settings().metrics_publish_interval:
+        return workers
+    for key, value in shared_store.items("metrics:"):
+        worker_pid = int(key.split(":", 1)[1])
+        if worker_pid == pid:
+            continue
+        try:
+            os.kill(worker_pid, 0)
+        except ProcessLookupError:
+            shared_store.delete(key)
+            continue
+        except PermissionError:
+            pass
+        workers[worker_pid] = json.loads(value)
+    return workers
+
+def format_labels(labels):
+    def escape(value):
+        return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return "{" + ",".join(f'{name}="{escape(value)}"' for name, value in labels.items()) + "}"
+
+def render_metrics(workers):
+    """Render the metrics of all workers in the Prometheus text format."""
+    series = {}
+    for pid, metrics in workers.items():
+        for name, metric_type, labels, value in metrics:
+            series.setdefault((name, metric_type), []).append((dict(labels, worker=str(pid)), value))
+    lines = []
+    for (name, metric_type), entries in sorted(series.items()):
+        lines.append(f"# TYPE {name} {metric_type}")
+        for labels, value in entries:
+            if metric_type != "histogram":
+                lines.append(f"{name}{format_labels(labels)} {value}")
+                continue
+            cumulative = 0
+            for bound, count in zip(Histogram.BUCKETS + ("+Inf",), value["counts"]):
+                cumulative += count
+                lines.append(f"{name}_bucket{format_labels(dict(labels, le=str(bound)))} {cumulative}")
+            lines.append(f"{name}_sum{format_labels(labels)} {value['sum']}")
+            lines.append(f"{name}_count{format_labels(labels)} {value['count']}")
+    return "\n".join(lines) + "\n"
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    try:
+        body = render_metrics(worker_metrics())
+    except Exception as e:
+        return create_response("Error: Failed to collect the metrics.", stderr=str(e), return_code=500)
+    return Response(body, mimetype="text/plain; version=0.0.4")
+
+background_tasks = [
+    ("session-timeout-sweeper", session_timeout_sweeper_loop),
+    ("token-revocation", token_revocation_loop),
+    ("session-watcher", session_watcher_loop),
+    ("activity-sampler", activity_sampler_loop),
+    ("memory-pressure", memory_pressure_loop)
+]
+background_lock_file = None
+
+def start_background_workers():
+    """Start the background tasks in exactly one API worker process.
+
+    Every worker waits for an exclusive lock on a file of the state dir and
+    the worker holding it runs the tasks. If that worker exits, the lock is
+    released and another worker takes over.
+    """
+    def run():
+        global background_lock_file
+        lock_path = os.path.join(get_settings().dcv_management_state_dir, "background.lock")
+        os.makedirs(os.path.dirname(lock_path), exist_ok=True)
+        lock_file = open(lock_path, "w")
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        background_lock_file = lock_file
+        logging.info(f"Process {os.getpid()} is running the background tasks.")
+        for name, target in background_tasks:
+            threading.Thread(target=target, name=name, daemon=True).start()
+
+    threading.Thread(target=run, name="background-leader", daemon=True).start()
+
+def serve():
+    """Serve the API with gunicorn (threaded workers), or the Flask server if gunicorn is missing."""
+    settings = get_settings()
+    workers = max(1, settings.dcv_management_workers)
+    threads = max(1, settings.dcv_management_threads)
+    bind = settings.dcv_management_bind
+
+    try:
+        from gunicorn.app.base import BaseApplication
+    except ImportError:
+        logging.warning("gunicorn is not installed. Using the Flask development server with a single process.")
+        host, _, port = bind.rpartition(":")
+        start_background_workers()
+        app.run(host=host or "127.0.0.1", port=int(port), debug=False, threaded=True)
+        return
+
+    class DcvManagementApplication(BaseApplication):
+        def load_config(self):
+            self.cfg.set("bind", [bind])
+            self.cfg.set("workers", workers)
+            self.cfg.set("threads", threads)
+            self.cfg.set("worker_class", "gthread")
+            self.cfg.set("post_worker_init", lambda worker: start_background_workers())
+
+        def load(self):
+            return app
+
+    DcvManagementApplication().run()
+
 @app.route('/list-sessions-owners', methods=['GET'])
 def list_sessions_owners():
     try:
-        # Call get_list_sessions_json to get the sessions as JSON.
-        response, status_code = get_list_sessions_json()
-        if status_code != 200:
-            return response, status_code
-
-        # Parse the response data to extract the list of sessions.
-        data = json.loads(response.get_data(as_text=True))
-        sessions = data.get("message", [])
-        
-        # Extract the "owner" value from each session.
-        owners = []
-        for session in sessions:
-            owner = session.get("owner")
-            if owner:
-                owners.append(owner)
-    
+        index = get_session_index()
+        if index is None:
+            return get_list_sessions_json()
+
+        owners = index.owners()
+
         return create_response(
             message=owners,
             stdout=json.dumps(owners),
@@ -954,22 +3932,12 @@ def list_sessions_owners():
 @app.route('/get-first-session', methods=['GET'])
 def get_first_session():
     try:
-        # Get the list-sessions response using the existing function
-        response, status_code = get_list_sessions()
-        # Parse the JSON data returned by get_list_sessions
-        data = json.loads(response.get_data(as_text=True))
-        message = data.get("message", "")
-        
-        # Split the message by newline to get individual session lines
-        lines = message.splitlines()
-        session_name = None  # Default null
-                
-        if lines:
-            first_line = lines[0]
-            # Use regex to match the session name inside single quotes after "Session: "
-            match = re.search(r"Session: '([^']+)'", first_line)
-            if match:
-                session_name = match.group(1)
+        index = get_session_index()
+        if index is None:
+            raise RuntimeError("dcv list-sessions failed")
+
+        first = index.first()
+        session_name = first.id if first is not None else None  # Default null
         
         # Return the session name; if session_name is None, jsonify will output null
         return create_response(
@@ -988,58 +3956,323 @@ def get_first_session():
 
 @app.route('/list-sessions', methods=['GET'])
 def get_list_sessions():
-    try:
-        command = " ".join(["dcv", "list-sessions"])
-        process = subprocess.Popen(command, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, stdin=subprocess.PIPE)
-        output, error = process.communicate()
-        output = output.decode("utf-8")
-        error = error.decode("utf-8")
-
-        return create_response(
-            message=output,
-            stdout=output,
-            stderr=error,
-            return_code=200
-        )
-    except Exception as e:
+    result = session_inventory_text.get()
+    if result["returncode"] == -1:
         return create_response(
             message="Error: Failed to run 'dcv list-sessions'",
             stdout=None,
-            stderr=str(e),
+            stderr=result["stderr"],
             return_code=500
         )
 
+    return create_response(
+        message=result["stdout"],
+        stdout=result["stdout"],
+        stderr=result["stderr"],
+        return_code=200
+    )
+
 @app.route('/list-sessions-json', methods=['GET'])
 def get_list_sessions_json():
-    try:
-        command = " ".join(["dcv", "list-sessions", "--json"])
-        process = subprocess.Popen(command, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, stdin=subprocess.PIPE)
-        output, error = process.communicate()
-        output = output.decode("utf-8")
-        error = error.decode("utf-8")
-
-        try:
-            json_output = json.loads(output)
-        except json.JSONDecodeError:
-            return create_response(
-                message="Error: Failed to parse JSON output",
-                stdout=None,
-                stderr="Invalid JSON format",
-                return_code=500
-            )
+    result = session_inventory.get()
+    if result["returncode"] == -1:
         return create_response(
-            message=json_output,
-            stdout=output,
-            stderr=error,
-            return_code=200
+            message="Error: Failed to run 'dcv list-sessions'",
+            stdout=None,
+            stderr=result["stderr"],
+            return_code=500
         )
-    except Exception as e:
+
+    if result["data"] is None:
         return create_response(
-            message="Error: Failed to run 'dcv list-sessions'",
+            message="Error: Failed to parse JSON output",
             stdout=None,
-            stderr=str(e),
+            stderr="Invalid JSON format",
             return_code=500
         )
+    return create_response(
+        message=result["data"].raw,
+        stdout=result["stdout"],
+        stderr=result["stderr"],
+        return_code=200
+    )
+
+class HttpConnectionPool:
+    """Keep-alive HTTP connections to the fleet peers, reused across requests."""
+
+    MAX_IDLE_PER_PEER = 4
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.idle = {}
+
+    def acquire(self, scheme, netloc, timeout):
+        with self.lock:
+            connections = self.idle.get((scheme, netloc))
+            if connections:
+                connection = connections.pop()
+                connection.timeout = timeout
+                if connection.sock is not None:
+                    connection.sock.settimeout(timeout)
+                return connection, True
+        connection_class = http.client.HTTPSConnection if scheme == "https" else http.client.HTTPConnection
+        return connection_class(netloc, timeout=timeout), False
+
+    def release(self, scheme, netloc, connection):
+        with self.lock:
+            connections = self.idle.setdefault((scheme, netloc), [])
+            if len(connections) < self.MAX_IDLE_PER_PEER:
+                connections.append(connection)
+                return
+        connection.close()
+
+    def get(self, url, timeout):
+        """GET url. Returns (status, body). A reused connection closed by the peer is retried once on a new one."""
+        parsed = urllib.parse.urlsplit(url)
+        path = (parsed.path or "/") + (f"?{parsed.query}" if parsed.query else "")
+        while True:
+            connection, reused = self.acquire(parsed.scheme, parsed.netloc, timeout)
+            try:
+                connection.request("GET", path)
+                response = connection.getresponse()
+                body = response.read()
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                connection.close()
+                if reused:
+                    continue
+                raise
+            except Exception:
+                connection.close()
+                raise
+            if response.will_close:
+                connection.close()
+            else:
+                self.release(parsed.scheme, parsed.netloc, connection)
+            return response.status, body
+
+class FleetAggregator:
+    """Answers of the fleet_peers dcv-management services (session lists, host metrics), fetched in parallel.
+
+    The answer of each peer is kept for fleet_snapshot_ttl seconds.
+    Expired answers are fetched again in parallel, at most one fetch per
+    peer and path at a time, and a peer that does not answer in
+    fleet_peer_timeout seconds is served from its last answer marked as
+    stale, up to fleet_snapshot_max_age seconds old.
+    """
+
+    def __init__(self):
+        self.pool = HttpConnectionPool()
+        self.lock = threading.Lock()
+        self.snapshots = {}
+        self.fetching = {}
+        self.executor = ThreadPoolExecutor(max_workers=32, thread_name_prefix="fleet")
+
+    def fetch(self, peer, path, timeout):
+        checked = time.time()
+        try:
+            status, body = self.pool.get(f"{peer}{path}", timeout)
+            data = json.loads(body)
+            if status != 200 or data.get("message") is None:
+                raise RuntimeError(f"HTTP {status}: {data.get('message')}")
+            snapshot = {"data": data["message"], "fetched": time.time(), "checked": checked, "error": None}
+        except Exception as e:
+            with self.lock:
+                previous = self.snapshots.get((peer, path)) or {"data": None, "fetched": None}
+            snapshot = {"data": previous["data"], "fetched": previous["fetched"], "checked": checked, "error": str(e) or type(e).__name__}
+        with self.lock:
+            self.snapshots[(peer, path)] = snapshot
+            self.fetching.pop((peer, path), None)
+
+    def peer_snapshots(self, path):
+        """One entry per peer with the message it answered for path (None if unknown), age in seconds, stale marker and last error."""
+        settings = get_settings()
+        peers = settings.fleet_peers
+        futures = []
+        with self.lock:
+            for peer in peers:
+                snapshot = self.snapshots.get((peer, path))
+                # failed peers are also retried only once per ttl
+                if snapshot is not None and time.time() - snapshot["checked"] < settings.fleet_snapshot_ttl:
+                    continue
+                future = self.fetching.get((peer, path))
+                if future is None:
+                    future = self.fetching[(peer, path)] = self.executor.submit(self.fetch, peer, path, settings.fleet_peer_timeout or None)
+                futures.append(future)
+        if futures:
+            wait_futures(futures, timeout=(settings.fleet_peer_timeout or None) and settings.fleet_peer_timeout + 0.5)
+
+        entries = []
+        now = time.time()
+        with self.lock:
+            for peer in peers:
+                snapshot = self.snapshots.get((peer, path)) or {"data": None, "fetched": None, "error": "Not fetched yet."}
+                age = now - snapshot["fetched"] if snapshot["fetched"] is not None else None
+                data = snapshot["data"]
+                if age is not None and settings.fleet_snapshot_max_age and age > settings.fleet_snapshot_max_age:
+                    data = None
+                entries.append({
+                    "peer": peer,
+                    "data": data,
+                    "age": round(age, 3) if age is not None else None,
+                    "stale": data is None or snapshot["error"] is not None or age > max(settings.fleet_snapshot_ttl, 1) + (settings.fleet_peer_timeout or 0),
+                    "error": snapshot["error"]
+                })
+        return entries
+
+    def sessions(self, predicate=None):
+        """(sessions, peers): the sessions of all peers with their "host", "stale" and "age", and the status of each peer."""
+        sessions = []
+        peers = []
+        for entry in self.peer_snapshots("/list-sessions-json"):
+            peer_sessions = entry.pop("data")
+            entry["sessions"] = len(peer_sessions) if isinstance(peer_sessions, list) else None
+            peers.append(entry)
+            for session in peer_sessions if isinstance(peer_sessions, list) else []:
+                if predicate is None or predicate(session):
+                    sessions.append(dict(session, host=entry["peer"], stale=entry["stale"], age=entry["age"]))
+        return sessions, peers
+
+fleet_aggregator = FleetAggregator()
+
+def fleet_disabled_response():
+    return create_response("Aggregator mode is disabled, set fleet_peers in settings.conf.", return_code=503)
+
+@app.route('/fleet/list-sessions-json', methods=['GET'])
+def fleet_list_sessions_json():
+    if not get_settings().fleet_peers:
+        return fleet_disabled_response()
+    sessions, peers = fleet_aggregator.sessions()
+    return create_response({"sessions": sessions, "peers": peers}, return_code=200)
+
+@app.route('/fleet/sessions-by-owner', methods=['GET'])
+def fleet_sessions_by_owner():
+    owner = request.args.get('owner')
+    if not owner:
+        return create_response("Missing owner parameter. Please specify owner in the query string.", return_code=400)
+    if not get_settings().fleet_peers:
+        return fleet_disabled_response()
+    sessions, peers = fleet_aggregator.sessions(lambda session: session.get("owner") == owner)
+    return create_response({"owner": owner, "sessions": sessions, "peers": peers}, return_code=200)
+
+@app.route('/fleet/connections', methods=['GET'])
+def fleet_connections():
+    if not get_settings().fleet_peers:
+        return fleet_disabled_response()
+    sessions, peers = fleet_aggregator.sessions()
+    for peer in peers:
+        peer["connections"] = sum(int(session.get("num-of-connections") or 0) for session in sessions if session["host"] == peer["peer"]) if peer["sessions"] is not None else None
+    connected = [
+        {"host": session["host"], "id": session.get("id"), "owner": session.get("owner"), "num-of-connections": session.get("num-of-connections"), "stale": session["stale"]}
+        for session in sessions if int(session.get("num-of-connections") or 0) > 0
+    ]
+    return create_response({"sessions": connected, "peers": peers}, return_code=200)
+
+def read_meminfo():
+    meminfo = {}
+    with open("/proc/meminfo") as f:
+        for line in f:
+            name, _, value = line.partition(":")
+            meminfo[name] = int(value.split()[0]) * 1024
+    return meminfo
+
+class HostMetricsSampler:
+    """Load of this host: sessions, connections, memory and CPU load, sampled at most every few seconds."""
+
+    TTL = 5
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.sample = None
+
+    def get(self):
+        with self.lock:
+            if self.sample is not None and time.time() - self.sample["sampled"] < self.TTL:
+                return self.sample
+            index = get_session_index()
+            if index is None:
+                raise RuntimeError("dcv list-sessions failed")
+            meminfo = read_meminfo()
+            with open("/proc/loadavg") as f:
+                load1 = float(f.read().split()[0])
+            self.sample = {
+                "hostname": socket.gethostname(),
+                "sessions": len(index.sessions),
+                "connections": sum(session.num_connections for session in index.sessions),
+                "mem_total": meminfo.get("MemTotal", 0),
+                "mem_available": meminfo.get("MemAvailable", meminfo.get("MemFree", 0)),
+                "load1": load1,
+                "cpus": os.cpu_count() or 1,
+                "sampled": time.time()
+            }
+            return self.sample
+
+host_metrics_sampler = HostMetricsSampler()
+
+@app.route('/host-metrics', methods=['GET'])
+def host_metrics():
+    try:
+        return create_response(host_metrics_sampler.get(), return_code=200)
+    except Exception as e:
+        return create_response("Error: Failed to sample the host metrics.", stderr=str(e), return_code=500)
+
+# relative weight of each part of the host load score
+PLACEMENT_WEIGHTS = {"sessions": 1.0, "connections": 1.0, "memory": 2.0, "cpu": 2.0}
+
+def score_hosts(candidates):
+    """Add a load "score" (lower is better) to each candidate with metrics, or an "excluded" reason.
+
+    Session and connection counts are compared with the busiest candidate;
+    used memory and CPU load (1 minute load average per CPU, capped at 2)
+    are absolute.
+    """
+    min_free_memory = get_settings().placement_min_free_memory_mb * 1024 * 1024
+    usable = []
+    for candidate in candidates:
+        metrics = candidate["metrics"]
+        if metrics is None or candidate["stale"]:
+            candidate["excluded"] = "no recent metrics"
+        elif metrics["mem_available"] < min_free_memory:
+            candidate["excluded"] = "not enough free memory"
+        else:
+            usable.append(candidate)
+    max_sessions = max([candidate["metrics"]["sessions"] for candidate in usable] + [1])
+    max_connections = max([candidate["metrics"]["connections"] for candidate in usable] + [1])
+    for candidate in usable:
+        metrics = candidate["metrics"]
+        parts = {
+            "sessions": metrics["sessions"] / max_sessions,
+            "connections": metrics["connections"] / max_connections,
+            "memory": 1 - metrics["mem_available"] / metrics["mem_total"] if metrics["mem_total"] else 1,
+            "cpu": min(metrics["load1"] / max(metrics["cpus"], 1), 2) / 2
+        }
+        candidate["score"] = round(sum(PLACEMENT_WEIGHTS[name] * value for name, value in parts.items()) / sum(PLACEMENT_WEIGHTS.values()), 4)
+    return sorted(usable, key=lambda candidate: candidate["score"])
+
+@app.route('/placement', methods=['GET'])
+def placement():
+    owner = request.args.get('owner')
+    if not owner:
+        return create_response("Missing owner parameter. Please specify owner in the query string.", return_code=400)
+
+    try:
+        if get_settings().fleet_peers:
+            candidates = [{"host": entry["peer"], "metrics": entry["data"] if isinstance(entry["data"], dict) else None, "stale": entry["stale"], "age": entry["age"], "error": entry["error"]} for entry in fleet_aggregator.peer_snapshots("/host-metrics")]
+            owner_sessions, peers = fleet_aggregator.sessions(lambda session: session.get("owner") == owner)
+            owner_hosts = [session["host"] for session in owner_sessions if not session["stale"]]
+        else:
+            candidates = [{"host": "local", "metrics": host_metrics_sampler.get(), "stale": False, "age": 0, "error": None}]
+            index = get_session_index()
+            owner_hosts = ["local"] if index is not None and index.owned_by(owner) else []
+    except Exception as e:
+        return create_response("Error: Failed to get the host metrics.", stderr=str(e), return_code=500)
+
+    ranked = score_hosts(candidates)
+    if owner_hosts:
+        # the user goes back to the session they already have
+        return create_response({"owner": owner, "host": owner_hosts[0], "reason": "existing_session", "candidates": candidates}, return_code=200)
+    if not ranked:
+        return create_response({"owner": owner, "host": None, "reason": "no_available_host", "candidates": candidates}, return_code=503)
+    return create_response({"owner": owner, "host": ranked[0]["host"], "reason": "least_loaded", "score": ranked[0]["score"], "candidates": candidates}, return_code=200)
 
 @app.route('/', methods=['GET'])
 def get_data():
@@ -1052,4 +4285,4 @@ def get_data():
 
 if __name__ == '__main__':
     logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
-    app.run(debug=False)
+    serve()
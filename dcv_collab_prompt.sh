@@ -88,7 +88,14 @@ fi
 # Retrieve User Session Information
 # ----------------------------
 
-read DISPLAY_VAR DBUS_SESSION_BUS_ADDRESS_VAR XAUTHORITY_VAR < <(get_user_session_info "$USERNAME")
+# The API service passes the session environment it already knows; otherwise look for it
+if [ -n "$DCV_USER_DISPLAY" ] && [ -n "$DCV_USER_DBUS_SESSION_BUS_ADDRESS" ] && [ -n "$DCV_USER_XAUTHORITY" ]; then
+    DISPLAY_VAR="$DCV_USER_DISPLAY"
+    DBUS_SESSION_BUS_ADDRESS_VAR="$DCV_USER_DBUS_SESSION_BUS_ADDRESS"
+    XAUTHORITY_VAR="$DCV_USER_XAUTHORITY"
+else
+    read DISPLAY_VAR DBUS_SESSION_BUS_ADDRESS_VAR XAUTHORITY_VAR < <(get_user_session_info "$USERNAME")
+fi
 
 # Export environment variables for GUI applications
 export DISPLAY="$DISPLAY_VAR"
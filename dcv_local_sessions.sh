@@ -15,192 +15,28 @@ then
     exec 2>"${debug_file_name}";set -x
 fi
 
-# check if collab feature is enabled
-curl_result=$(curl -s http://${hostname}:${port}/check-collab-settings 2> /dev/null)
+# the API service does all the collab/virtual session checks and returns the exit code to use
+# exit codes:
+#   0 - login authorized
+#   1 - failed to create the session (collab disabled)
+#   2 - failed to create the session (collab enabled, but the collab session is closed)
+#   3 - collab login denied by the session owner
+#   12 - the API service is not reachable or was not able to list the sessions
+#   14 - no session created by the DCV server was found (session_auto_creation_by_dcv=true)
+#   18 - collab login denied by the session owner (session_auto_creation_by_dcv=true)
+curl_result=$(curl -s -G --data-urlencode "username=${username}" http://${hostname}:${port}/pam/authorize 2> /dev/null)
 
 if [[ "${curl_result}x" == x ]]
 then
     exit 12
 fi
 
-processNotifications()
-{
-    curl -s http://${hostname}:${port}/process-notification-auth?username=${username} 2> /dev/null
-}
+exit_code=$(echo "$curl_result" | jq -r '.message.exit_code')
 
-authApproved()
-{
-    processNotifications
-    exit 0
-}
-
-collab_enabled=$(echo "$curl_result" | jq -r '.message.collab_enabled')
-session_type=$(echo "$curl_result" | jq -r '.message.session_type')
-session_auto_creation_by_dcv=$(echo $curl_result | jq -r '.message.session_auto_creation_by_dcv')
-
-
-if ! echo $collab_enabled | egrep -iq "(true|false)"
-then
-    exit 13
-fi
-
-if ! echo $session_auto_creation_by_dcv | egrep -iq "(true|false)"
-then
-    exit 16
-fi
-
-# if enabled, and the dcv server auto creation is enabled
-if echo $collab_enabled | egrep -iq "true"
-then
-    if echo $session_auto_creation_by_dcv | egrep -iq "true"
-    then
-        # get the id of the session created by DCV
-        curl_result=$(curl -s http://${hostname}:${port}/list-sessions-json)
-        session_id=$(echo "$curl_result" | jq -r '.message[0].id')
-
-        # Verify that an id was indeed extracted
-        if [ -z "$session_id" ] || [ "$session_id" = "null" ]
-        then
-            echo "Error: session id not found in JSON output." >&2
-            exit 14
-        fi
-
-        number_of_connections=$(echo "$curl_result" | jq -r '.message[0]["num-of-connections"]')
-        if [ -z "$number_of_connections" ] || [ "$number_of_connections" = "null" ]
-        then
-            echo "Error: number_of_connections not found in JSON output." >&2
-            exit 15
-        fi        
-
-        # if is the first user connected, it will be the owner
-        if [ "$number_of_connections" -eq 0 ]
-        then
-            curl_result=$(curl -s -X POST "http://${hostname}:${port}/collab-set-session-owner?session_owner=${username}&session_id=${session_id}")
-            authApproved
-        else
-            curl_result=$(curl -s -X GET "http://${hostname}:${port}/collab-get-session-owner")
-            collab_session_owner=$(echo $curl_result | jq -r '.message.collab_session_owner')
-
-            # if is not the first user connected, but is the owner
-            if [[ "$username" == "$collab_session_owner" ]]
-            then
-                authApproved
-            # if is not the first user connected, and is not the owner
-            else
-                curl_result=$(curl -s -X POST "http://${hostname}:${port}/approve-login?collab_session_owner=${collab_session_owner}&collab_username=${username}&number_of_connections=$number_of_connections&session_id=${session_id}")
-                approval=$(echo "$curl_result" | jq -r ".message")
-
-                if echo $approval | egrep -iq "true"
-                then
-                    authApproved
-                else
-                    exit 18
-                fi
-            fi
-        fi
-    fi
-fi
-
-
-# if enabled, get the collab session name
-if echo $collab_enabled | egrep -iq "true"
-then
-    collab_session_name=$(echo "$curl_result" | jq -r '.message.session_name')
-    if ! echo ${collab_session_name} | egrep -iq "null"
-    then
-        curl_result=$(curl -s http://${hostname}:${port}/get-session-owner?session_name=${collab_session_name})
-        collab_session_owner=$(echo "$curl_result" | jq -r '.message.owner')
-    else
-        curl_result=$(curl -s http://${hostname}:${port}/get-first-session)
-        collab_session_name=$(echo "$curl_result" | jq -r '.message')
-        if ! echo $collab_session_name | egrep -iq "null"
-        then
-            curl_result=$(curl -s http://${hostname}:${port}/get-session-owner?session_name=${collab_session_name})
-            collab_session_owner=$(echo "$curl_result" | jq -r '.message.owner')
-        else
-            collab_session_owner="thereisnocollabsessionavailable"
-        fi
-    fi
-fi
-
-# check if there is a session created
-if curl -s http://${hostname}:${port}/list-sessions 2> /dev/null | egrep -iq "Session: [']${username}[']"
+if ! echo $exit_code | egrep -q "^[0-9]+$"
 then
-    session_created="true"
-else
-    session_created="false"
-fi
-
-# if collab is false
-if echo $collab_enabled | egrep -iq "false"
-then
-    # if there is no session
-    if echo $session_created | egrep -iq "false"
-    then
-        # create the session
-        curl -s http://${hostname}:${port}/create-session?owner=$username 2>&1 >> /dev/null
-        if [ $? -eq 0 ]
-        then
-            authApproved
-        else
-            exit 1
-        fi
-    # if there is a session
-    else
-        authApproved
-    fi
-fi
-
-# if collab feature is enabled
-if echo $collab_enabled | egrep -iq "true"
-then
-    # and the collab session is opened
-    if curl -s http://${hostname}:${port}/list-sessions 2> /dev/null | egrep -iq "Session: [']${collab_session_name}[']"
-    then
-        # and if the user is the collab session owner
-        if echo $username | egrep -iq "^${collab_session_owner}$"
-        then
-            authApproved
-        # and the user is not the collab session owner
-        else
-            # get the id of the session created by DCV
-            curl_result=$(curl -s http://${hostname}:${port}/list-sessions-json)
-            session_id=$(echo "$curl_result" | jq -r '.message[0].id')
-
-            # Verify that an id was indeed extracted
-            if [ -z "$session_id" ] || [ "$session_id" = "null" ]
-            then
-                echo "Error: session id not found in JSON output." >&2
-                exit 21
-            fi
-
-            number_of_connections=$(echo "$curl_result" | jq -r '.message[0]["num-of-connections"]')
-            if [ -z "$number_of_connections" ] || [ "$number_of_connections" = "null" ]
-            then
-                echo "Error: number_of_connections not found in JSON output." >&2
-               exit 22
-            fi
-            curl_result=$(curl -s -X POST "http://${hostname}:${port}/approve-login?collab_session_owner=${collab_session_owner}&collab_username=${username}&number_of_connections=$number_of_connections&session_id=${session_id}")
-            approval=$(echo "$curl_result" | jq -r ".message")
-
-            if echo $approval | egrep -iq "true"
-            then
-                authApproved
-            else
-                exit 3
-            fi
-        fi
-    # and if the collab session is closed
-    else
-        curl -s http://${hostname}:${port}/create-session?owner=$username 2>&1 >> /dev/null
-        if [ $? -eq 0 ]
-        then
-            authApproved
-        else
-            exit 2
-        fi
-    fi
+    # unknown error, do not authorize
+    exit 255
 fi
 
-# unknown error, do not authorize
-exit 255
+exit $exit_code
@@ -65,7 +65,14 @@ get_user_session_info() {
 }
 
 # Retrieve and export GNOME session variables for the target user.
-read DISPLAY_VAR DBUS_SESSION_BUS_ADDRESS_VAR XAUTHORITY_VAR < <(get_user_session_info "$TARGET_USER")
+# The API service passes the session environment it already knows; otherwise look for it.
+if [ -n "$DCV_USER_DISPLAY" ] && [ -n "$DCV_USER_DBUS_SESSION_BUS_ADDRESS" ] && [ -n "$DCV_USER_XAUTHORITY" ]; then
+    DISPLAY_VAR="$DCV_USER_DISPLAY"
+    DBUS_SESSION_BUS_ADDRESS_VAR="$DCV_USER_DBUS_SESSION_BUS_ADDRESS"
+    XAUTHORITY_VAR="$DCV_USER_XAUTHORITY"
+else
+    read DISPLAY_VAR DBUS_SESSION_BUS_ADDRESS_VAR XAUTHORITY_VAR < <(get_user_session_info "$TARGET_USER")
+fi
 export DISPLAY="$DISPLAY_VAR"
 export DBUS_SESSION_BUS_ADDRESS="$DBUS_SESSION_BUS_ADDRESS_VAR"
 export XAUTHORITY="$XAUTHORITY_VAR"
@@ -118,6 +118,7 @@ createDirectories()
     sudo mkdir -p $dcv_tokens_path
     sudo mkdir -p /etc/dcv-management/sessions-permissions.d
     sudo mkdir -p /etc/dcv-management/notifications.d/
+    sudo mkdir -p $dcv_management_state_dir
 }
 
 createSettingsFile()
@@ -130,8 +131,50 @@ dcv_collab=false
 dcv_collab_prompt_timeout=20
 dcv_collab_session_name=
 dcv_collab_sessions_permissions_dir=/etc/dcv-management/sessions-permissions.d
+dcv_collab_prompt_script=$dcv_collab_prompt_script
+dcv_collab_max_prompts_per_owner=3
+dcv_collab_approval_cache_ttl=900
+dcv_notify_users_script=$dcv_notify_users
+permissions_apply_window_ms=50
 dcv_management_maintenance_dir=/etc/dcv-management/notifications.d/
 dcv_management_maintenance_timeout=20
+dcv_management_maintenance_expired_action=archive
+dcv_management_maintenance_max_concurrency=20
+session_timeout_sweep_interval=300
+session_timeout_sweep_workers=8
+session_timeout_cpu_threshold=0
+session_timeout_cpu_minutes=30
+activity_sample_interval=30
+memory_pressure_interval=10
+memory_pressure_min_available_percent=0
+memory_pressure_max_psi_some=0
+memory_pressure_settle_seconds=5
+memory_pressure_protect=
+memory_pressure_dry_run=false
+dcv_management_bind=127.0.0.1:5000
+dcv_management_workers=2
+dcv_management_threads=8
+dcv_management_state_dir=/var/lib/dcv-management
+dcv_tokens_path=$dcv_tokens_path
+metrics_publish_interval=5
+fleet_peers=
+fleet_peer_timeout=3
+fleet_snapshot_ttl=2
+fleet_snapshot_max_age=300
+placement_min_free_memory_mb=1024
+session_watch_interval=2
+session_watch_stream_timeout=300
+session_watch_max_streams=2
+session_events_retention=3600
+ssh_pool_max_per_host=4
+ssh_pool_idle_timeout=300
+ssh_keepalive_interval=30
+dcv_command_timeout=60
+dcv_command_max_concurrency=16
+dcv_command_max_concurrency_per_command=8
+prompt_command_timeout=120
+prompt_command_max_concurrency=200
+prompt_command_max_concurrency_per_command=200
 EOF
    
     # do not create the file again if already exist
@@ -194,6 +237,7 @@ setupPythonRequiredLibraries()
     sudo "${python3_bin}" -m pip install Flask --ignore-installed -U blinker
     sudo "${python3_bin}" -m pip install --upgrade setuptools
     sudo "${python3_bin}" -m pip install paramiko
+    sudo "${python3_bin}" -m pip install gunicorn
 }
 
 setAuthTokenVerifier()
@@ -217,73 +261,26 @@ setupScripts()
         sudo chmod +x $script_name
     done
 
-    # Create the script that will create and return the token
+    # Create the script that will create and return the token; the API service stores the token and revokes it when it expires
     cat <<EOF | sudo tee /usr/bin/dcv_get_token
 #!/bin/bash
 
-dcv_tokens_path="$dcv_tokens_path"
 token_expiration_time_in_seconds=\$1
-token=\$(openssl rand -hex 8 | tr -d '\n')
-token_timestamp=\$(date +%s)
 
 if echo \$token_expiration_time_in_seconds | egrep -iq "^[0-9]+$"
 then
-        echo \$token | sudo dcvsimpleextauth add-user --session \$USER --auth-dir /var/run/dcvsimpleextauth/ --user \$USER --append
-
-        cat <<END_DATA | sudo tee \${dcv_tokens_path}/\${USER}.\${token} | > /dev/null
-\${USER};\${token};\${token_timestamp};\${token_expiration_time_in_seconds}
-END_DATA
-
-        echo \$token
+        curl -s -X POST -G --data-urlencode "user=\${USER}" --data-urlencode "time_token_expire=\${token_expiration_time_in_seconds}" http://localhost:${dcv_management_port}/tokens | jq -r '.stdout'
 else
         echo "Expire time is invalid. Please insert a integer value greater than 0, in seconds."
 fi
 EOF
 
-    # create the script that will close expired tokens
-    cat <<EOF | sudo tee /usr/bin/dcv_tokens_check
-#!/bin/bash
-
-tokens_files_list=\$(ls $dcv_tokens_path)
-for token_file in \$tokens_files_list
-do
-        session_id=\$(cat \$token_file | cut -d";" -f1)
-        session_token=\$(cat \$token_file | cut -d";" -f2)
-        session_timestamp=\$(cat \$token_file | cut -d";" -f3)
-        session_expiration_time=\$(cat \$token_file | cut -d";" -f4)
-        current_time=\$(date +%s)
-        time_diff=\$(( current_time - session_timestamp))
-        if [[ \$time_diff -gt \$session_expiration_time ]]
-        then
-                sudo dcvsimpleextauth remove-auth --session \$session_id
-                sudo rm -f \$token_file
-        fi
-done
-
-EOF
-
-    # Create the service that will check the created tokens
-    cat <<EOF | sudo tee /etc/systemd/system/dcvtoken.service
-[Unit]
-Description=DCV Tokens checks service
-
-[Service]
-Type=oneshot
-After=network.target
-User=root
-ExecStart=/bin/bash /usr/bin/dcv_tokens_check
-EOF
-
-    cat <<EOF | sudo tee /etc/systemd/system/dcvtoken.timer
-[Unit]
-Description=Timer to execute dcvtoken.service oneshot
-
-[Timer]
-OnCalendar=*:0/10
-
-[Install]
-WantedBy=timers.target
-EOF
+    # the tokens expiration runs inside of the API service; remove the timer from old setups
+    if [ -f /etc/systemd/system/dcvtoken.timer ]
+    then
+        sudo systemctl disable --now dcvtoken.timer
+        sudo rm -f /etc/systemd/system/dcvtoken.service /etc/systemd/system/dcvtoken.timer /usr/bin/dcv_tokens_check
+    fi
 
     # Create DCV Management systemd service
     cat <<EOF | sudo tee /etc/systemd/system/dcv-management.service
@@ -302,14 +299,10 @@ Restart=always
 WantedBy=multi-user.target
 EOF
 
-    # create the dcv_local_sessions_timedout script
+    # create the dcv_local_sessions_timedout script to trigger a session timeout sweep manually
     cat <<EOF | sudo tee /usr/bin/dcv_local_sessions_timedout
 #!/bin/bash
-session_list=\$(curl -s http://localhost:5000/list-sessions-json | jq -r '.message[] | .id' | paste -sd " " )
-for session_id in \$session_list
-do
-	curl -s http://localhost:5000/check-session-timedout?session_id=\$session_id &> /dev/null
-done
+curl -s -X POST http://localhost:5000/sweep-timeouts
 EOF
 
     # create the custom dcv pam file
@@ -359,18 +352,10 @@ EOF
     sudo chmod +x /usr/bin/dcv_local_sessions
     sudo chmod +x /usr/bin/dcv_local_sessions_timedout
 
-    if [ ! -f /var/spool/cron/root ]
-    then
-    	sudo touch /var/spool/cron/root
-    	sudo chmod 600 /var/spool/cron/root
-    fi
-
-    # setup the cron to execute dcv_local_sessions_timedout
-    if ! cat /var/spool/cron/root | egrep -iq "dcv_local_sessions_timedout"
+    # the session timeout sweep runs inside of the API service; remove the cron from old setups
+    if [ -f /var/spool/cron/root ]
     then
-        cat <<EOF | sudo tee --append /var/spool/cron/root
-0,30 * * * * /usr/bin/dcv_local_sessions_timedout &> /dev/null
-EOF
+        sudo sed -i '/dcv_local_sessions_timedout/d' /var/spool/cron/root
     fi
 }
 
@@ -379,7 +364,6 @@ enableSystemdServices()
     # enable the services
     sudo systemctl daemon-reload
     sudo systemctl enable --now dcv-management.service
-    sudo systemctl enable --now dcvtoken.timer
 }
 
 restartSystemdServices()
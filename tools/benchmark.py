@@ -0,0 +1,303 @@
+#!/usr/bin/env python3
+"""Benchmark of the DCV Management API service with fake DCV commands.
+
+Starts api/app.py with a temporary settings file and fake "dcv", "sudo",
+"dcvsimpleextauth", collab prompt and notification scripts first on the
+PATH, then simulates concurrent DCV logins doing the same HTTP call as
+dcv_local_sessions.sh (GET /pam/authorize).
+
+Every fake command writes one line to a log, so the report counts the
+processes started per login next to the login latency percentiles and
+the throughput. The report is printed (and optionally saved) as JSON, to
+compare two versions of the service:
+
+    python3 tools/benchmark.py --logins 500 --concurrency 50 --output before.json
+    python3 tools/benchmark.py --mode collab --dcv-latency 0.2 --prompt-latency 1
+
+Nothing is installed: no root access and no DCV server are needed.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+import urllib.request
+import urllib.parse
+import urllib.error
+import subprocess
+import argparse
+import tempfile
+import platform
+import shutil
+import socket
+import json
+import time
+import sys
+import os
+
+REPOSITORY_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+FAKE_DCV = r'''#!/usr/bin/env python3
+import fcntl, json, os, sys, time
+
+state_path = os.environ["FAKE_DCV_STATE"]
+with open(os.environ["FAKE_CALLS_LOG"], "a") as log:
+    log.write("dcv " + (sys.argv[1] if len(sys.argv) > 1 else "") + "\n")
+time.sleep(float(os.environ["FAKE_DCV_LATENCY"]))
+
+def load(lock):
+    fcntl.flock(lock, fcntl.LOCK_EX if sys.argv[1] in ("create-session", "close-session") else fcntl.LOCK_SH)
+    with open(state_path) as f:
+        return json.load(f)
+
+def save(sessions):
+    with open(state_path + ".tmp", "w") as f:
+        json.dump(sessions, f)
+    os.replace(state_path + ".tmp", state_path)
+
+args = sys.argv[1:]
+with open(state_path + ".lock", "a") as lock:
+    sessions = load(lock)
+    if args[0] == "list-sessions":
+        if "--json" in args:
+            print(json.dumps(sessions))
+        else:
+            for session in sessions:
+                print(f"Session: '{session['id']}' (owner:{session['owner']} type:{session['type']})")
+    elif args[0] == "create-session":
+        session_id = args[-1]
+        if any(session["id"] == session_id for session in sessions):
+            print(f"Session '{session_id}' already exists", file=sys.stderr)
+            sys.exit(1)
+        sessions.append({"id": session_id, "owner": args[args.index("--owner") + 1], "type": args[args.index("--type") + 1],
+                         "num-of-connections": 0, "creation-time": "2024-01-01T00:00:00.000000Z", "last-disconnection-time": ""})
+        save(sessions)
+    elif args[0] == "close-session":
+        save([session for session in sessions if session["id"] != args[1]])
+    elif args[0] == "describe-session":
+        matches = [session for session in sessions if session["id"] == args[1]]
+        if not matches:
+            sys.exit(1)
+        print(json.dumps(matches[0]))
+'''
+
+FAKE_SUDO = '''#!/bin/bash
+echo "sudo" >> "$FAKE_CALLS_LOG"
+while [[ "$1" == -* ]]; do [[ "$1" == "-u" ]] && shift; shift; done
+exec "$@"
+'''
+
+FAKE_PROMPT = '''#!/bin/bash
+echo "%(name)s" >> "$FAKE_CALLS_LOG"
+sleep "$FAKE_PROMPT_LATENCY"
+echo "%(answer)s"
+'''
+
+FAKE_DCVSIMPLEEXTAUTH = '''#!/bin/bash
+echo "dcvsimpleextauth" >> "$FAKE_CALLS_LOG"
+cat > /dev/null
+'''
+
+def write_script(path, content):
+    with open(path, "w") as f:
+        f.write(content)
+    os.chmod(path, 0o755)
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def create_sessions(args):
+    """Sessions that exist before the benchmark starts."""
+    sessions = []
+    if args.mode == "virtual":
+        for number in range(args.sessions):
+            user = f"user{number}"
+            sessions.append({"id": user, "owner": user, "type": "virtual", "num-of-connections": 1,
+                             "creation-time": "2024-01-01T00:00:00.000000Z", "last-disconnection-time": ""})
+    else:
+        sessions.append({"id": "console", "owner": "owner", "type": "console", "num-of-connections": 1,
+                         "creation-time": "2024-01-01T00:00:00.000000Z", "last-disconnection-time": ""})
+    return sessions
+
+def create_environment(args, directory):
+    bin_dir = os.path.join(directory, "bin")
+    for name in ("bin", "state", "permissions", "notifications"):
+        os.makedirs(os.path.join(directory, name))
+
+    write_script(os.path.join(bin_dir, "dcv"), FAKE_DCV)
+    write_script(os.path.join(bin_dir, "sudo"), FAKE_SUDO)
+    write_script(os.path.join(bin_dir, "dcvsimpleextauth"), FAKE_DCVSIMPLEEXTAUTH)
+    write_script(os.path.join(bin_dir, "dcv_collab_prompt"), FAKE_PROMPT % {"name": "dcv_collab_prompt", "answer": "true" if args.approve else "false"})
+    write_script(os.path.join(bin_dir, "dcv_notify_users"), FAKE_PROMPT % {"name": "dcv_notify_users", "answer": "ok"})
+
+    with open(os.path.join(directory, "sessions.json"), "w") as f:
+        json.dump(create_sessions(args), f)
+
+    settings = {
+        "session_type": "virtual" if args.mode == "virtual" else "console",
+        "dcv_collab": "false" if args.mode == "virtual" else "true",
+        "session_auto_creation_by_dcv": "false",
+        "dcv_collab_prompt_timeout": "20",
+        "dcv_collab_prompt_script": os.path.join(bin_dir, "dcv_collab_prompt"),
+        "dcv_notify_users_script": os.path.join(bin_dir, "dcv_notify_users"),
+        "dcv_collab_sessions_permissions_dir": os.path.join(directory, "permissions"),
+        "dcv_management_maintenance_dir": os.path.join(directory, "notifications"),
+        "dcv_management_state_dir": os.path.join(directory, "state"),
+        "dcv_management_bind": f"127.0.0.1:{args.port}",
+        "dcv_management_workers": str(args.workers),
+        "dcv_management_threads": str(args.threads),
+        "dcv_tokens_path": os.path.join(directory, "tokens"),
+        # the background pollers run dcv too; disabled so the forks counted are the ones of the logins
+        "session_watch_interval": "0",
+        "activity_sample_interval": "0",
+        "session_timeout_sweep_interval": "0",
+        "memory_pressure_interval": "0",
+    }
+    settings_path = os.path.join(directory, "settings.conf")
+    with open(settings_path, "w") as f:
+        f.writelines(f"{key}={value}\n" for key, value in settings.items())
+
+    environment = dict(os.environ)
+    environment.update({
+        "PATH": bin_dir + os.pathsep + environment.get("PATH", ""),
+        "DCV_MANAGEMENT_SETTINGS": settings_path,
+        "FAKE_DCV_STATE": os.path.join(directory, "sessions.json"),
+        "FAKE_DCV_LATENCY": str(args.dcv_latency),
+        "FAKE_PROMPT_LATENCY": str(args.prompt_latency),
+        "FAKE_CALLS_LOG": os.path.join(directory, "calls.log"),
+    })
+    return environment
+
+def start_service(args, environment, directory):
+    log = open(os.path.join(directory, "service.log"), "w")
+    process = subprocess.Popen([sys.executable, args.app], cwd=os.path.dirname(args.app), env=environment, stdout=log, stderr=subprocess.STDOUT)
+    deadline = time.monotonic() + args.startup_timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"The API service exited with {process.returncode}, see {log.name}")
+        try:
+            urllib.request.urlopen(f"http://127.0.0.1:{args.port}/", timeout=1).read()
+            return process
+        except OSError:
+            time.sleep(0.1)
+    process.terminate()
+    raise RuntimeError(f"The API service did not answer in {args.startup_timeout} seconds, see {log.name}")
+
+def login(port, username):
+    """The call done by dcv_local_sessions.sh. Returns (latency, exit_code)."""
+    url = f"http://127.0.0.1:{port}/pam/authorize?" + urllib.parse.urlencode({"username": username})
+    started = time.monotonic()
+    try:
+        with urllib.request.urlopen(url, timeout=300) as response:
+            exit_code = json.loads(response.read())["message"]["exit_code"]
+    except urllib.error.HTTPError as e:
+        exit_code = json.loads(e.read() or b"{}").get("message", {}).get("exit_code", 255)
+    except Exception:
+        # dcv_local_sessions.sh exits with 12 when the service does not answer
+        exit_code = 12
+    return time.monotonic() - started, exit_code
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+def count_calls(path):
+    calls = {}
+    if os.path.exists(path):
+        with open(path) as f:
+            for line in f:
+                calls[line.strip()] = calls.get(line.strip(), 0) + 1
+    return calls
+
+def run_logins(args, users):
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        started = time.monotonic()
+        results = list(executor.map(lambda user: login(args.port, user), users))
+        return results, time.monotonic() - started
+
+def benchmark(args):
+    directory = tempfile.mkdtemp(prefix="dcv-management-benchmark-")
+    try:
+        environment = create_environment(args, directory)
+        process = start_service(args, environment, directory)
+        try:
+            if args.warmup:
+                run_logins(args, [f"user{number % args.users}" for number in range(args.warmup)])
+            calls_log = environment["FAKE_CALLS_LOG"]
+            if os.path.exists(calls_log):
+                os.remove(calls_log)
+            # virtual mode: the first --sessions users already have a session, the others get one created
+            results, elapsed = run_logins(args, [f"user{number % args.users}" for number in range(args.logins)])
+            # give the calls started by the last logins the time to be written
+            time.sleep(0.2)
+            calls = count_calls(calls_log)
+        finally:
+            process.terminate()
+            process.wait(timeout=30)
+    finally:
+        if args.keep:
+            print(f"Benchmark files kept in {directory}", file=sys.stderr)
+        else:
+            shutil.rmtree(directory, ignore_errors=True)
+
+    latencies = [latency for latency, _ in results]
+    exit_codes = {}
+    for _, exit_code in results:
+        exit_codes[str(exit_code)] = exit_codes.get(str(exit_code), 0) + 1
+    forks = sum(calls.values())
+    return {
+        "app": os.path.relpath(args.app, REPOSITORY_DIR),
+        "python": platform.python_version(),
+        "parameters": {
+            "mode": args.mode, "logins": args.logins, "concurrency": args.concurrency, "users": args.users,
+            "sessions": args.sessions, "dcv_latency": args.dcv_latency, "prompt_latency": args.prompt_latency,
+            "workers": args.workers, "threads": args.threads, "warmup": args.warmup,
+        },
+        "elapsed_seconds": round(elapsed, 3),
+        "throughput_logins_per_second": round(len(results) / elapsed, 2) if elapsed else None,
+        "latency_ms": {
+            "p50": round(percentile(latencies, 0.50) * 1000, 2),
+            "p95": round(percentile(latencies, 0.95) * 1000, 2),
+            "p99": round(percentile(latencies, 0.99) * 1000, 2),
+            "max": round(max(latencies) * 1000, 2),
+            "mean": round(sum(latencies) / len(latencies) * 1000, 2),
+        },
+        "exit_codes": exit_codes,
+        "forks_total": forks,
+        "forks_per_login": round(forks / len(results), 3),
+        "forks_by_command": calls,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulate concurrent DCV logins against the DCV Management API service with fake DCV commands.")
+    parser.add_argument("--mode", choices=("virtual", "collab"), default="virtual", help="virtual: one session per user; collab: logins ask the owner of a console session (default virtual)")
+    parser.add_argument("--logins", type=int, default=200, help="number of logins (default 200)")
+    parser.add_argument("--concurrency", type=int, default=20, help="logins running at the same time (default 20)")
+    parser.add_argument("--users", type=int, default=100, help="number of different users logging in (default 100)")
+    parser.add_argument("--sessions", type=int, default=50, help="virtual sessions existing before the benchmark (default 50)")
+    parser.add_argument("--dcv-latency", type=float, default=0.05, help="seconds taken by each fake dcv command (default 0.05)")
+    parser.add_argument("--prompt-latency", type=float, default=0.5, help="seconds taken by the fake owner answer and notification (default 0.5)")
+    parser.add_argument("--deny", dest="approve", action="store_false", help="the fake collab session owner denies the logins")
+    parser.add_argument("--warmup", type=int, default=0, help="logins done before the measured ones (default 0)")
+    parser.add_argument("--workers", type=int, default=2, help="API service processes (default 2)")
+    parser.add_argument("--threads", type=int, default=8, help="threads per API service process (default 8)")
+    parser.add_argument("--port", type=int, default=0, help="port of the API service (default: a free port)")
+    parser.add_argument("--app", default=os.path.join(REPOSITORY_DIR, "api", "app.py"), help="app.py to benchmark, e.g. from another checkout")
+    parser.add_argument("--startup-timeout", type=float, default=30, help="seconds to wait for the API service to start (default 30)")
+    parser.add_argument("--output", help="also save the JSON report to this file")
+    parser.add_argument("--keep", action="store_true", help="keep the temporary directory with the settings, fake commands and service log")
+    args = parser.parse_args()
+    args.app = os.path.abspath(args.app)
+    if not args.port:
+        args.port = free_port()
+
+    report = benchmark(args)
+    output = json.dumps(report, indent=2, sort_keys=True)
+    print(output)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+
+if __name__ == "__main__":
+    main()
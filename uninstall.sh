@@ -9,6 +9,7 @@ sudo systemctl disable dcv-management.service
 # remove the services directories
 sudo rm -rf $dcv_management_dir
 sudo rm -rf $dcv_tokens_path
+sudo rm -rf $dcv_management_state_dir
 
 # remove scripts
 sudo rm -f /usr/bin/dcv_get_token